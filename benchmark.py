@@ -0,0 +1,315 @@
+"""Benchmarks for opening, previewing, searching and saving documents in Scratchpad.
+
+Runs headless on synthetic corpora and writes the results as JSON, so runs
+can be compared across commits:
+
+    python benchmark.py --out before.json
+    python benchmark.py --out after.json --compare before.json
+
+Every case runs in its own process so peak RSS is measured per case.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ.setdefault('SCRATCHPAD_RECOVERY_DIR', os.path.join(tempfile.gettempdir(), 'scratchpad-benchmark-recovery'))
+
+KINDS = {
+    'plain': 'utf-8',
+    'markdown': 'utf-8',
+    'cp1252': 'cp1252',
+    'shift_jis': 'shift_jis',
+}
+CASES = ('open', 'preview', 'find', 'replace', 'save')
+SIZE_UNITS = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+DEFAULT_SIZES = '10K,1M,10M'
+# Above this size the preview is not benchmarked; it renders the whole document.
+PREVIEW_MAX_BYTES = 10 * 1024 * 1024
+KEYSTROKES = 10
+SEARCH_WORD = 'lorem'
+CASE_TIMEOUT_S = 600
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+         'incididunt ut labore et dolore magna aliqua').split()
+CP1252_WORDS = WORDS + ['café', 'naïve', 'façade', 'déjà', 'über', 'señor']
+SHIFT_JIS_WORDS = WORDS + ['日本語', 'テキスト', 'ファイル', '編集', '保存']
+
+def parse_size(text):
+    """Parse sizes such as 10K, 1M or 500M into bytes."""
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f'{size // SIZE_UNITS[unit]}{unit}'
+    return str(size)
+
+def plain_paragraph(rng, words):
+    lines = []
+    for _ in range(rng.randint(3, 8)):
+        lines.append(' '.join(rng.choice(words) for _ in range(rng.randint(6, 14))).capitalize() + '.')
+    return '\n'.join(lines) + '\n\n'
+
+def markdown_section(rng):
+    """Return a section of Markdown that is heavy in code blocks and tables."""
+    number = rng.randint(0, 1 << 30)
+    rows = '\n'.join(f'| {rng.choice(WORDS)} | {rng.randint(0, 999)} | `{rng.choice(WORDS)}` |'
+                     for _ in range(rng.randint(3, 10)))
+    return (f'## Section {number}\n\n'
+            f'{plain_paragraph(rng, WORDS)}'
+            f'```python\ndef handler_{number}(value):\n'
+            f'    """{rng.choice(WORDS)} {rng.choice(WORDS)}."""\n'
+            f'    return [item * {rng.randint(2, 9)} for item in value if item]\n```\n\n'
+            f'| name | count | code |\n|------|-------|------|\n{rows}\n\n'
+            f'- **{rng.choice(WORDS)}** item\n- *{rng.choice(WORDS)}* item\n\n'
+            f'> {rng.choice(WORDS)} {rng.choice(WORDS)}\n\n')
+
+def generate_corpus(kind, size, directory):
+    """Write a deterministic synthetic file of about size bytes and return its path."""
+    extension = 'md' if kind == 'markdown' else 'txt'
+    path = os.path.join(directory, f'{kind}-{format_size(size)}.{extension}')
+    if os.path.exists(path) and os.path.getsize(path) >= size:
+        return path
+    rng = random.Random(f'{kind}-{size}')
+    words = {'cp1252': CP1252_WORDS, 'shift_jis': SHIFT_JIS_WORDS}.get(kind, WORDS)
+    encoding = KINDS[kind]
+    # Generate a few MB of distinct text and repeat it, which keeps 500 MB corpora quick to build.
+    pool = []
+    pool_size = 0
+    while pool_size < min(size, 4 * 1024 * 1024):
+        piece = markdown_section(rng) if kind == 'markdown' else plain_paragraph(rng, words)
+        data = piece.encode(encoding)
+        pool.append(data)
+        pool_size += len(data)
+    written = 0
+    with open(path + '.tmp', 'wb') as file:
+        while written < size:
+            for data in pool:
+                file.write(data)
+                written += len(data)
+                if written >= size:
+                    break
+    os.replace(path + '.tmp', path)
+    return path
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def wait_until(app, condition, timeout=CASE_TIMEOUT_S):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError('benchmark step timed out')
+        app.processEvents()
+        time.sleep(0.0005)
+
+def open_document(app, window, path):
+    """Load path into window and return the seconds it took."""
+    started = time.perf_counter()
+    window.startLoading(path)
+    # The Cancel button is hidden again once loading has finished.
+    wait_until(app, window.cancel_load_button.isHidden)
+    return time.perf_counter() - started
+
+def run_case(kind, size, case, path):
+    """Run one benchmark case in this process and return its metrics."""
+    from PyQt5.QtWidgets import QApplication
+    import scratchpad
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    window = scratchpad.Scratchpad()
+    window.resize(1200, 800)
+    window.show()
+    app.processEvents()
+    result = {'kind': kind, 'size': format_size(size), 'bytes': size, 'case': case}
+    open_seconds = open_document(app, window, path)
+    large = window.large_view is not None
+    result['mode'] = 'large-file' if large else 'editor'
+    if case == 'open':
+        result['open_ms'] = open_seconds * 1000
+    elif large:
+        result['skipped'] = 'files in the read-only large-file view are only opened'
+    elif case == 'preview':
+        if size > PREVIEW_MAX_BYTES:
+            result['skipped'] = f'documents over {format_size(PREVIEW_MAX_BYTES)} are not previewed'
+        else:
+            result.update(measure_preview(app, window))
+    elif case in ('find', 'replace'):
+        result.update(measure_search(app, window, case == 'replace'))
+    elif case == 'save':
+        result.update(measure_save(app, window))
+    result['peak_rss_mb'] = peak_rss_mb()
+    shut_down(window)
+    return result
+
+def shut_down(window):
+    """Stop the window's worker threads so the process can exit cleanly."""
+    window.editor.document().setModified(False)
+    window.cancelLoading()
+    for thread in (window.file_handler, window.file_saver):
+        if thread is not None:
+            thread.wait()
+    window.editor.renderer.stop()
+    window.close()
+
+def measure_preview(app, window):
+    """Time the first render and the keystroke-to-preview latency."""
+    editor = window.editor
+    editor.set_preview_debounce(0)
+    rendered = []
+    editor.renderer.pieces_ready.connect(lambda revision, pieces: rendered.append(revision))
+    started = time.perf_counter()
+    window.togglePreview()
+    wait_until(app, lambda: editor.preview_revision in rendered)
+    app.processEvents()
+    first_render = time.perf_counter() - started
+    latencies = []
+    cursor = editor.textCursor()
+    cursor.movePosition(cursor.End)
+    editor.setTextCursor(cursor)
+    for _ in range(KEYSTROKES):
+        started = time.perf_counter()
+        editor.insertPlainText('x')
+        wait_until(app, lambda: editor.preview_revision in rendered and not editor.preview_timer.isActive())
+        app.processEvents()
+        latencies.append(time.perf_counter() - started)
+    return {'preview_first_render_ms': first_render * 1000,
+            'keystroke_to_preview_ms': statistics.median(latencies) * 1000,
+            'keystroke_to_preview_max_ms': max(latencies) * 1000,
+            'preview_debounce_ms': 0}
+
+def measure_search(app, window, replace):
+    """Time counting every match, and optionally replacing them all."""
+    import scratchpad
+
+    dialog = scratchpad.FindReplaceDialog(window.editor)
+    dialog.find_input.setText(SEARCH_WORD)
+    started = time.perf_counter()
+    dialog.start_search()
+    wait_until(app, lambda: not dialog.workers)
+    app.processEvents()
+    result = {'find_ms': (time.perf_counter() - started) * 1000, 'matches': len(dialog.starts)}
+    if replace:
+        revision = window.editor.document().revision()
+        dialog.replace_input.setText(SEARCH_WORD.upper())
+        started = time.perf_counter()
+        dialog.replace_all()
+        wait_until(app, lambda: window.editor.document().revision() != revision and not dialog.workers)
+        result['replace_all_ms'] = (time.perf_counter() - started) * 1000
+    dialog.done(0)
+    return result
+
+def measure_save(app, window):
+    """Time saving the document to a new file in its original encoding."""
+    window.editor.insertPlainText('x')
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        window.current_file = path
+        started = time.perf_counter()
+        window.saveFileWithEncoding(window.encoding)
+        window.waitForSave()
+        return {'save_ms': (time.perf_counter() - started) * 1000,
+                'saved_bytes': os.path.getsize(path)}
+    finally:
+        os.remove(path)
+
+def run_in_subprocess(kind, size, case, path):
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', kind, str(size), case, path]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=CASE_TIMEOUT_S)
+    except subprocess.TimeoutExpired:
+        return {'kind': kind, 'size': format_size(size), 'case': case, 'error': 'timed out'}
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith('{'):
+            return json.loads(line)
+    error = completed.stderr.strip().splitlines()
+    return {'kind': kind, 'size': format_size(size), 'case': case,
+            'error': error[-1] if error else f'exit status {completed.returncode}'}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def case_key(result):
+    return result['kind'], result['size'], result['case']
+
+def compare(results, baseline):
+    """Print each timing next to the baseline run's."""
+    previous = {case_key(result): result for result in baseline['results']}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for result in results:
+        before = previous.get(case_key(result))
+        if not before:
+            continue
+        for metric, value in result.items():
+            if metric.endswith(('_ms', '_mb')) and isinstance(value, (int, float)) and before.get(metric):
+                change = (value - before[metric]) / before[metric] * 100
+                print(f"  {'/'.join(case_key(result))} {metric}: {before[metric]:.1f} -> {value:.1f} ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"comma-separated corpus sizes (default {DEFAULT_SIZES}; up to 500M)")
+    parser.add_argument('--kinds', default=','.join(KINDS), help="comma-separated corpus kinds")
+    parser.add_argument('--cases', default=','.join(CASES), help="comma-separated cases")
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'scratchpad-benchmark'),
+                        help="where generated corpora are kept between runs")
+    parser.add_argument('--out', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='JSON', help="print changes against an earlier results file")
+    parser.add_argument('--run-case', nargs=4, metavar=('KIND', 'BYTES', 'CASE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        kind, size, case, path = args.run_case
+        print(json.dumps(run_case(kind, int(size), case, path)), flush=True)
+        return 0
+
+    os.makedirs(args.corpus_dir, exist_ok=True)
+    results = []
+    for kind in args.kinds.split(','):
+        for size in map(parse_size, args.sizes.split(',')):
+            path = generate_corpus(kind, size, args.corpus_dir)
+            for case in args.cases.split(','):
+                result = run_in_subprocess(kind, size, case, path)
+                results.append(result)
+                metrics = ', '.join(f'{key}={value:.1f}' if isinstance(value, float) else f'{key}={value}'
+                                    for key, value in result.items() if key not in ('kind', 'size', 'bytes', 'case'))
+                print(f"{kind:<10} {format_size(size):>5} {case:<8} {metrics}", flush=True)
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+    return 1 if any('error' in result for result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""Markdown to HTML conversion for the Scratchpad preview.
+
+Kept free of Qt so it can be imported lazily, the first time a preview is
+rendered, and reused outside the editor.
+"""
+import re
+import hashlib
+import threading
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from tracing import tracer
+from text_encoding import detect_encoding
+import markdown
+from markdown.extensions import Extension
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from markdown.inlinepatterns import InlineProcessor, SimpleTagInlineProcessor
+from markdown.preprocessors import Preprocessor
+from markdown.treeprocessors import Treeprocessor
+import xml.etree.ElementTree as etree
+
+# Syntax whose meaning depends on the whole document (footnotes, abbreviations,
+# reference links, [TOC] and raw HTML blocks). Documents using it are always
+# rendered in one pass.
+GLOBAL_MARKDOWN_RE = re.compile(r'\[\^|^ {0,3}\*\[|^ {0,3}\[[^\]\n]+\]:|\[TOC\]|^ {0,3}<', re.M)
+# Lines that may continue the block above them even after a blank line.
+BLOCK_CONTINUATION_RE = re.compile(r'\s|[-*+]\s|\d+[.)]\s|[>:<]')
+DEFINITION_LINE_RE = re.compile(r' {0,3}:\s')
+HTML_ID_RE = re.compile(r'\sid="([^"]*)"')
+STYLE_RE = re.compile(r'<style[^>]*>(.*?)</style>', re.S | re.I)
+BLOCK_SENTINEL = 'scratchpadblockend'
+HIGHLIGHT_CACHE_BYTES = 16 * 1024 * 1024
+TEMPLATE_BEGIN = '/* ===== BEGIN_MARKDOWN_TEMPLATE =====\n'
+TEMPLATE_END = '===== END_MARKDOWN_TEMPLATE =====\n*/'
+MARKDOWN_EXTENSIONS = ('.md', '.markdown', '.mdown', '.mkd')
+RENDER_MANIFEST = '.scratchpad-render.json'
+# Render ~~, 'quotes' and blockquotes with the old string rewrites of the
+# finished HTML, for notes written to look right under them.
+LEGACY_MARKDOWN = bool(os.environ.get('SCRATCHPAD_LEGACY_MARKDOWN'))
+STRIKETHROUGH_RE = r'(~~)(?!~)(.+?)~~'
+# Quotes that are not apostrophes: not preceded or followed by a word character.
+MONOSPACE_RE = r"(?<![\w'])'([^'\n]+?)'(?![\w'])"
+LEGACY_MONOSPACE_RE = re.compile(r"'([^']+)'")
+BLOCKQUOTE_STYLE = 'display: inline-block; margin-left: 20px;'
+
+class HighlightCache:
+    """LRU cache of highlighted code keyed by (language, code, style).
+
+    Entries are evicted oldest first once their combined size (code plus
+    HTML, in characters) exceeds max_bytes.
+    """
+    def __init__(self, max_bytes=HIGHLIGHT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached HTML for key, or None."""
+        with self.lock:
+            html = self.entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        """Store HTML for key, evicting least recently used entries."""
+        entry_size = len(key[1]) + len(html)
+        if entry_size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(key[1]) + len(self.entries.pop(key))
+            self.entries[key] = html
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                old_key, old_html = self.entries.popitem(last=False)
+                self.size -= len(old_key[1]) + len(old_html)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self.lock:
+            self.entries.clear()
+            self.size = self.hits = self.misses = 0
+
+highlight_cache = HighlightCache()
+
+class CachedFencedCodePreprocessor(Preprocessor):
+    """Highlight fenced code blocks through the shared highlight cache.
+
+    Runs just before fenced_code and takes the plain fences (an optional
+    language, no attribute list or hl_lines); the rest are left to fenced_code.
+    """
+    def __init__(self, md, codehilite):
+        super().__init__(md)
+        self.codehilite = codehilite
+
+    def run(self, lines):
+        text = "\n".join(lines)
+        config = self.codehilite.getConfigs()
+        index = 0
+        while m := FencedBlockPreprocessor.FENCED_BLOCK_RE.search(text, index):
+            if m.group('attrs') is not None or m.group('hl_lines') is not None:
+                index = m.end()
+                continue
+            code = self.highlight(m.group('code'), m.group('lang') or None, config)
+            placeholder = self.md.htmlStash.store(code)
+            text = f'{text[:m.start()]}\n{placeholder}\n{text[m.end():]}'
+            index = m.start() + 1 + len(placeholder)
+        return text.split("\n")
+
+    def highlight(self, code, lang, config):
+        """Return highlighted HTML for code, using the cache when possible."""
+        config = config.copy()
+        style = config.pop('pygments_style', 'default')
+        key = (lang, code, style)
+        html = highlight_cache.get(key)
+        if html is None:
+            html = CodeHilite(code, lang=lang, style=style, **config).hilite(shebang=False)
+            highlight_cache.put(key, html)
+        return html
+
+class HighlightCacheExtension(Extension):
+    """Markdown extension that caches pygments output for fenced code."""
+    def __init__(self, codehilite, **kwargs):
+        self.codehilite = codehilite
+        super().__init__(**kwargs)
+
+    def extendMarkdown(self, md):
+        md.preprocessors.register(CachedFencedCodePreprocessor(md, self.codehilite), 'cached_fenced_code', 26)
+
+class MonospaceInlineProcessor(InlineProcessor):
+    """Render 'text' in single quotes as <span class="monospace">."""
+    def handleMatch(self, m, data):
+        element = etree.Element('span')
+        element.set('class', 'monospace')
+        element.text = m.group(1)
+        return element, m.start(0), m.end(0)
+
+class QuotedBlockquoteTreeprocessor(Treeprocessor):
+    """Indent blockquote contents and wrap them in quotation marks.
+
+    Runs after smarty and prettify, so the marks stay straight quotes and
+    the layout matches the old string rewrite.
+    """
+    def run(self, root):
+        for blockquote in list(root.iter('blockquote')):
+            wrapper = etree.Element('span')
+            wrapper.set('style', BLOCKQUOTE_STYLE)
+            wrapper.text = '"' + (blockquote.text or '')
+            for child in list(blockquote):
+                blockquote.remove(child)
+                wrapper.append(child)
+            if len(wrapper):
+                wrapper[-1].tail = (wrapper[-1].tail or '') + '"'
+            else:
+                wrapper.text += '"'
+            blockquote.text = None
+            blockquote.append(wrapper)
+
+class ScratchpadSyntaxExtension(Extension):
+    """Scratchpad's additions to Markdown: ~~strikethrough~~, 'monospace' and quoted blockquotes.
+
+    They run inside the parse, so code, raw HTML and attributes are left alone.
+    """
+    def extendMarkdown(self, md):
+        md.inlinePatterns.register(SimpleTagInlineProcessor(STRIKETHROUGH_RE, 's'), 'strikethrough', 66)
+        md.inlinePatterns.register(MonospaceInlineProcessor(MONOSPACE_RE, md), 'monospace', 65)
+        md.treeprocessors.register(QuotedBlockquoteTreeprocessor(md), 'quoted_blockquote', 1)
+
+def legacy_post_process(html):
+    """Apply the old string rewrites to converted HTML."""
+    html = html.replace('~~', '<s>')
+    html = LEGACY_MONOSPACE_RE.sub(r'<span class="monospace">\1</span>', html)
+    html = html.replace('<blockquote>', f'<blockquote><span style="{BLOCKQUOTE_STYLE}">"')
+    return html.replace('</blockquote>', '"</span></blockquote>')
+
+def create_markdown(legacy=False):
+    """Create a Markdown converter configured with the preview extensions."""
+    codehilite = CodeHiliteExtension(css_class='codehilite', noclasses=True, pygments_style='monokai')
+    extensions = [
+        'fenced_code',
+        'tables', 
+        'nl2br',
+        'abbr',
+        'attr_list',
+        'def_list',
+        'footnotes',
+        'md_in_html',
+        'sane_lists',
+        'smarty',
+        'toc',
+        'extra',
+        codehilite,
+        HighlightCacheExtension(codehilite)
+    ]
+    if not legacy:
+        extensions.append(ScratchpadSyntaxExtension())
+    return markdown.Markdown(extensions=extensions)
+
+def split_markdown_blocks(text):
+    """Split markdown into top-level blocks that render independently."""
+    lines = text.splitlines(True)
+    fences = [m.span() for m in FencedBlockPreprocessor.FENCED_BLOCK_RE.finditer(text)]
+    # A paragraph that holds, or is followed by, a definition line may be
+    # merged into a definition list above it, so it cannot start a block.
+    in_definition = [False] * len(lines)
+    has_definition = next_is_definition = False
+    for i in range(len(lines) - 1, -1, -1):
+        if not lines[i].strip():
+            if i + 1 < len(lines) and lines[i + 1].strip():
+                next_is_definition = bool(DEFINITION_LINE_RE.match(lines[i + 1]))
+            has_definition = False
+        else:
+            has_definition = has_definition or bool(DEFINITION_LINE_RE.match(lines[i]))
+            in_definition[i] = has_definition or next_is_definition
+    blocks = []
+    start = pos = fence_index = 0
+    previous_blank = False
+    for i, line in enumerate(lines):
+        if (previous_blank and line.strip() and not in_definition[i]
+                and not BLOCK_CONTINUATION_RE.match(line)):
+            while fence_index < len(fences) and fences[fence_index][1] <= pos:
+                fence_index += 1
+            if not (fence_index < len(fences) and fences[fence_index][0] < pos):
+                blocks.append(text[start:pos])
+                start = pos
+        previous_blank = not line.strip()
+        pos += len(line)
+    blocks.append(text[start:])
+    return blocks
+
+class IncrementalMarkdownRenderer:
+    """Markdown converter that only re-renders blocks whose content changed.
+
+    Each block is converted with a trailing sentinel paragraph so the
+    whitespace Markdown would emit between it and the next block is kept,
+    which makes the joined output identical to a full conversion. Documents
+    with global syntax, or whose blocks produce clashing element ids (which
+    `toc` would have de-duplicated), fall back to a full conversion.
+    With legacy set, the output is post-processed by legacy_post_process.
+    """
+    def __init__(self, legacy=LEGACY_MARKDOWN):
+        self.legacy = legacy
+        self.md = create_markdown(legacy)
+        self.cache = {}
+
+    def convert(self, text):
+        """Convert markdown text to HTML."""
+        return ''.join(html for _, html, _ in self.convert_pieces(text)).strip()
+
+    def convert_pieces(self, text):
+        """Convert markdown text to (key, html, source lines) pieces, one per block.
+
+        key is a hash of the block's source, or None for a single piece
+        holding a full conversion.
+        """
+        if GLOBAL_MARKDOWN_RE.search(text) or BLOCK_SENTINEL in text:
+            return [(None, self.convert_full(text), text.count('\n') + 1)]
+        cache = {}
+        pieces = []
+        seen_ids = set()
+        for block in split_markdown_blocks(text):
+            key = hashlib.blake2b(block.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+            entry = cache.get(key) or self.cache.get(key) or self.convert_block(block)
+            cache[key] = entry
+            html, ids = entry
+            if not seen_ids.isdisjoint(ids):
+                return [(None, self.convert_full(text), text.count('\n') + 1)]
+            seen_ids.update(ids)
+            pieces.append((key, html, block.count('\n')))
+        self.cache = cache
+        return pieces
+
+    def convert_block(self, block):
+        """Convert one block, returning its HTML and the element ids it defines."""
+        if not block.strip():
+            # Before the sentinel, blank lines would read as an empty code block.
+            return '', frozenset()
+        self.md.reset()
+        html = self.md.convert(f'{block}\n\n{BLOCK_SENTINEL}')
+        html = html[:-len(f'<p>{BLOCK_SENTINEL}</p>')]
+        return html, frozenset(HTML_ID_RE.findall(html))
+
+    def convert_full(self, text):
+        """Convert the whole document in a single pass."""
+        self.cache = {}
+        self.md.reset()
+        return self.md.convert(text)
+
+def render_markdown(renderer, text, template, full=False):
+    """Convert markdown text to the full preview HTML document.
+
+    full skips the per-block cache, which only pays off when the same
+    document is rendered again; the output is the same either way.
+    """
+    with tracer.span('markdown convert', 'preview', length=len(text)):
+        html = renderer.convert_full(text) if full else renderer.convert(text)
+    if renderer.legacy:
+        with tracer.span('post-process', 'preview'):
+            html = legacy_post_process(html)
+
+    with tracer.span('template', 'preview'):
+        prefix, suffix = template
+        return f'{prefix}{html}{suffix}'
+
+def render_preview_pieces(renderer, text):
+    """Convert markdown text to the (key, html, source lines) pieces the preview shows."""
+    with tracer.span('markdown convert', 'preview', length=len(text)):
+        pieces = renderer.convert_pieces(text)
+    if renderer.legacy:
+        with tracer.span('post-process', 'preview'):
+            html = legacy_post_process(''.join(html for _, html, _ in pieces).strip())
+        pieces = [(None, html, text.count('\n') + 1)]
+    return pieces
+
+def template_stylesheet(template):
+    """Return the CSS inside the template's <style> elements."""
+    return '\n'.join(STYLE_RE.findall(template[0] + template[1]))
+
+def parse_markdown_template(css_content):
+    """Split the HTML template embedded in style.css around its {content} placeholder."""
+    template_start = css_content.find(TEMPLATE_BEGIN)
+    template_end = css_content.find(TEMPLATE_END)
+    if template_start == -1 or template_end == -1:
+        raise FileNotFoundError("HTML template not found in style.css")
+    template = css_content[template_start + len(TEMPLATE_BEGIN):template_end].strip()
+    prefix, _, suffix = template.partition('{content}')
+    return prefix, suffix
+
+def editor_text(data, encoding='utf-8-sig'):
+    """Decode a markdown file the way the editor presents it to the preview."""
+    text = data.decode(encoding, errors='replace')
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    # QTextDocument.toPlainText() turns these into plain spaces and newlines.
+    return text.replace('\u00a0', ' ').replace('\u2028', '\n').replace('\u2029', '\n')
+
+def collect_markdown_files(sources, out_dir):
+    """Map each markdown file under sources to the HTML file it renders to."""
+    tasks = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(MARKDOWN_EXTENSIONS):
+                        path = os.path.join(root, name)
+                        tasks.append((path, os.path.relpath(path, source)))
+        else:
+            tasks.append((source, os.path.basename(source)))
+    return [(path, os.path.join(out_dir, os.path.splitext(relative)[0] + '.html')) for path, relative in tasks]
+
+_batch_template = None
+_batch_renderer = None
+
+def init_batch_worker(template, legacy=LEGACY_MARKDOWN):
+    global _batch_template, _batch_renderer
+    _batch_template = template
+    _batch_renderer = IncrementalMarkdownRenderer(legacy)
+
+def render_file(task):
+    """Render one file; return (source, destination, key, input bytes, error)."""
+    source, destination, key = task
+    try:
+        with open(source, 'rb') as file:
+            data = file.read()
+        text = editor_text(data, detect_encoding(source))
+        html = render_markdown(_batch_renderer, text, _batch_template, full=True)
+        os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+        with open(destination, 'wb') as file:
+            file.write(html.encode('utf-8'))
+        return source, destination, key, len(data), None
+    except Exception as e:
+        # A note that trips up Markdown or Pygments fails on its own instead of ending the batch.
+        return source, destination, key, 0, str(e) or type(e).__name__
+
+def content_key(path, template_digest):
+    """Hash a source file together with the template and Markdown version."""
+    digest = hashlib.blake2b(template_digest, digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def render_batch(sources, out_dir, template, jobs=None, report=print, legacy=LEGACY_MARKDOWN):
+    """Render markdown files to HTML pages identical to the editor preview.
+
+    Files are spread over a process pool. A manifest in out_dir records a
+    content hash per source, so unchanged files whose output still exists
+    are skipped. Returns the number of files that failed.
+    """
+    started = time.perf_counter()
+    manifest_path = os.path.join(out_dir, RENDER_MANIFEST)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+    prefix, suffix = template
+    template_digest = f'{markdown.__version__}\0{legacy}\0{prefix}\0{suffix}'.encode('utf-8')
+    tasks = []
+    skipped = failed = 0
+    claimed = {}
+    for source, destination in collect_markdown_files(sources, out_dir):
+        # Files given by name render to their base name, which a file of the
+        # same name elsewhere can share; the first one keeps it.
+        target = os.path.normcase(os.path.abspath(destination))
+        if target in claimed:
+            if os.path.abspath(claimed[target]) != os.path.abspath(source):
+                report(f"{source}: not rendered, {destination} is already rendered from {claimed[target]}")
+                failed += 1
+            continue
+        claimed[target] = source
+        try:
+            key = content_key(source, template_digest)
+        except OSError as e:
+            report(f"{source}: {e}")
+            failed += 1
+            continue
+        if manifest.get(os.path.relpath(destination, out_dir)) == key and os.path.exists(destination):
+            skipped += 1
+        else:
+            tasks.append((source, destination, key))
+    rendered = input_bytes = 0
+    if tasks:
+        os.makedirs(out_dir, exist_ok=True)
+        workers = jobs or os.cpu_count() or 1
+        if workers == 1 or len(tasks) == 1:
+            init_batch_worker(template, legacy)
+            results = map(render_file, tasks)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                                       initargs=(template, legacy))
+            results = pool.map(render_file, tasks, chunksize=max(1, len(tasks) // (workers * 8)))
+        try:
+            for source, destination, key, size, error in results:
+                if error:
+                    report(f"{source}: {error}")
+                    failed += 1
+                    continue
+                manifest[os.path.relpath(destination, out_dir)] = key
+                rendered += 1
+                input_bytes += size
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        with open(manifest_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=0, sort_keys=True)
+    elapsed = time.perf_counter() - started
+    report(f"Rendered {rendered} files ({input_bytes / (1024 * 1024):.1f} MB), skipped {skipped} unchanged, "
+           f"{failed} failed in {elapsed:.2f} s ({rendered / elapsed:.0f} files/s, "
+           f"{input_bytes / (1024 * 1024) / elapsed:.1f} MB/s)")
+    return failed
@@ -1,123 +1,1873 @@
+import time
+STARTUP_STARTED = time.perf_counter()
 import sys
 import os
-import requests
-import validators
-import chardet
-import markdown
-from markdown.extensions import fenced_code, tables, nl2br
-from markdown.extensions.codehilite import CodeHiliteExtension
-from pygments.formatters import HtmlFormatter
-from chardet.universaldetector import UniversalDetector
+import re
+import hashlib
+import io
+import codecs
+import mmap
+import multiprocessing
+import argparse
+import getpass
+import tempfile
+import bisect
+import json
+import glob
+import uuid
+import pickle
+import zlib
+from array import array
+from itertools import accumulate, groupby
+from contextlib import contextmanager, nullcontext
+import threading
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTextEdit, QAction,
                              QFileDialog, QMessageBox, QStatusBar, QDialog,
                              QVBoxLayout, QLabel, QLineEdit, QPushButton, QHBoxLayout,
-                             QSplitter, QInputDialog)
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
-from PyQt5.QtGui import QIcon, QTextCursor, QTextDocument
+                             QSplitter, QInputDialog, QAbstractScrollArea, QCheckBox,
+                             QProgressBar, QTabBar, QWidget)
+from PyQt5.QtCore import (QThread, QObject, QTimer, QFileSystemWatcher, QPoint, QEvent, QLockFile, pyqtSignal,
+                          pyqtSlot, Qt)
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+from PyQt5.QtGui import (QIcon, QTextCursor, QTextDocument, QPainter, QPalette, QColor, QTextCharFormat,
+                         QTextBlockFormat, QTextFrameFormat, QTextDocumentFragment, QSyntaxHighlighter,
+                         QTextBlockUserData, QTextLayout, QFont, QKeySequence)
+from tracing import tracer
+from text_encoding import ENCODING_HEAD_BYTES, BYTE_ORDER_MARKS, detect_encoding
+
+PREVIEW_DEBOUNCE_MS = 150
+# Syntax highlighting formats blocks this far beyond the viewport eagerly and
+# stops a pass after this long, finishing the rest from the event loop.
+HIGHLIGHT_MARGIN_BLOCKS = 100
+HIGHLIGHT_BUDGET_MS = 8
+HEADING_RE = re.compile(r' {0,3}#{1,6}(?:\s|$)')
+FENCE_OPEN_RE = re.compile(r' {0,3}(`{3,}(?=[^`]*$)|~{3,})')
+FENCE_CLOSE_RE = re.compile(r' {0,3}(`{3,}|~{3,})\s*$')
+INLINE_CODE_RE = re.compile(r'(`+)(?!`).*?(?<!`)\1(?!`)')
+STRONG_RE = re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1')
+EMPHASIS_RE = re.compile(r'(?<![*\w])\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?!\*)|(?<![_\w])_(?=[^\s_])(.+?)(?<=[^\s_])_(?![_\w])')
+STRIKETHROUGH_HIGHLIGHT_RE = re.compile(r'~~(?=\S)(.+?)(?<=\S)~~')
+LINK_RE = re.compile(r'!?\[[^\]\n]*\]\([^)\s]*(?:\s+"[^"]*")?\)|<(?:https?|ftp|mailto):[^>\s]+>')
+INSTANCE_CONNECT_TIMEOUT_MS = 200
+INSTANCE_REPLY_TIMEOUT_MS = 2000
+LINE_ARGUMENT_RE = re.compile(r'\+(\d+)$')
+# Clean background tabs release their documents, least recently used first,
+# once the open documents are estimated to use more than this.
+TAB_MEMORY_BUDGET_MB = int(os.environ.get('SCRATCHPAD_TAB_MEMORY_MB', 256))
+TAB_BYTES_PER_CHARACTER = 4
+TAB_BYTES_PER_BLOCK = 256
+# Undo steps beyond this, oldest first, are compressed into a temporary file.
+UNDO_MEMORY_MB = int(os.environ.get('SCRATCHPAD_UNDO_MEMORY_MB', 32))
+UNDO_STEP_OVERHEAD = 256
+# difflib's line matching grows quadratically; longer changed runs are kept whole.
+UNDO_DIFF_MAX_LINES = 10000
+# Keys that only move the cursor or select, so the editor reads no text for undo before them.
+NAVIGATION_KEYS = (Qt.Key_Left, Qt.Key_Right, Qt.Key_Up, Qt.Key_Down, Qt.Key_Home, Qt.Key_End, Qt.Key_PageUp,
+                   Qt.Key_PageDown, Qt.Key_Shift, Qt.Key_Control, Qt.Key_Alt, Qt.Key_Meta)
+STARTUP_BUDGET_MS = 1500
+LARGE_FILE_THRESHOLD = 256 * 1024 * 1024
+LINE_INDEX_STRIDE = 128
+# The index is built from chunks of this size, each checked for cancellation.
+LINE_INDEX_CHUNK_BYTES = 8 * 1024 * 1024
+# Only ever matched where the newlines are known to be there; a failing search backtracks quadratically.
+LINE_GROUP_RE = re.compile(rb'(?:[^\n]*\n){%d}' % LINE_INDEX_STRIDE)
+SEARCH_DEBOUNCE_MS = 150
+SELECTION_STATS_DELAY_MS = 250
+MATCH_HIGHLIGHT_COLOR = "#ffe97a"
+WEB_IMPORT_MAX_BYTES = 32 * 1024 * 1024
+WEB_IMPORT_TIMEOUT = (5, 30)
+WEB_IMPORT_CHUNK_BYTES = 64 * 1024
+WEB_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'scratchpad', 'web')
+WEB_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RECOVERY_DIR = os.environ.get('SCRATCHPAD_RECOVERY_DIR') or os.path.join(
+    os.path.expanduser('~'), '.local', 'share', 'scratchpad', 'recovery')
+JOURNAL_COMMIT_MS = 1000
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+FOLLOW_DEBOUNCE_MS = 100
+# Change notifications do not arrive for every filesystem (network shares),
+# so followed files are also checked this often.
+FOLLOW_POLL_MS = 1000
+FOLLOW_READ_BYTES = 4 * 1024 * 1024
+# ~/spstyle.css appearing is noticed when the app regains focus, or at worst this often.
+USER_STYLE_POLL_MS = 5000
+# Characters that QTextDocument counts as two positions (UTF-16 surrogate pairs).
+ASTRAL_CHAR_RE = re.compile('[\U00010000-\U0010ffff]')
+# Encodings where a b'\n' byte is not always a line break.
+WIDE_ENCODINGS = ('utf-16', 'utf-32')
+# The umask can only be read by setting it, which would race with files
+# created on other threads, so it is read once at import.
+UMASK = os.umask(0)
+os.umask(UMASK)
+NEW_FILE_MODE = 0o666 & ~UMASK
+
+class PreviewRenderer(QObject):
+    """Worker object that renders markdown previews on its own thread."""
+    render_requested = pyqtSignal(int, str)
+    pieces_ready = pyqtSignal(int, object)
+
+    def __init__(self):
+        super().__init__()
+        self.markdown_renderer = None
+        self.latest_revision = 0
+        self.thread = QThread()
+        self.moveToThread(self.thread)
+        self.render_requested.connect(self.render)
+        self.thread.start()
+        app = QApplication.instance()
+        if app:
+            app.aboutToQuit.connect(self.stop, Qt.DirectConnection)
+
+    def request(self, revision, text):
+        """Queue a render; any older revision still waiting is dropped."""
+        self.latest_revision = revision
+        self.render_requested.emit(revision, text)
+
+    @pyqtSlot(int, str)
+    def render(self, revision, text):
+        """Render the requested revision unless a newer one is queued."""
+        if revision != self.latest_revision:
+            return
+        try:
+            from markdown_preview import IncrementalMarkdownRenderer, render_preview_pieces
+            if self.markdown_renderer is None:
+                self.markdown_renderer = IncrementalMarkdownRenderer()
+            pieces = render_preview_pieces(self.markdown_renderer, text)
+        except Exception as e:
+            print(f"Error rendering markdown preview: {e}")
+            return
+        if revision == self.latest_revision:
+            self.pieces_ready.emit(revision, pieces)
+
+    def stop(self):
+        """Stop the render thread."""
+        self.thread.quit()
+        self.thread.wait()
+
+class DocumentStats(QObject):
+    """Character, word and line counts kept up to date from contentsChange.
+
+    Counts are stored per block, so an edit only recounts the blocks it
+    touched and reading the totals costs nothing. One is kept per document,
+    as its child, so switching tabs reuses the counts; text added before
+    the document was laid out emits no contentsChange, and catch_up()
+    counts it.
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, document, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.revision = None
+        self.block_chars = []
+        self.block_words = []
+        self.characters = 0
+        self.words = 0
+        document.contentsChange.connect(self.on_contents_change)
+        self.catch_up()
+
+    @property
+    def lines(self):
+        return len(self.block_chars)
+
+    def catch_up(self):
+        """Count the document from scratch if it changed unseen, then report the counts."""
+        document = self.document
+        if document.revision() != self.revision:
+            self.revision = document.revision()
+            self.block_chars, self.block_words = self.count_blocks(document.begin(), document.blockCount())
+            self.characters = sum(self.block_chars) + len(self.block_chars) - 1
+            self.words = sum(self.block_words)
+        self.changed.emit()
+
+    @staticmethod
+    def count_blocks(block, count):
+        """Return character and word counts for count blocks starting at block."""
+        chars, words = [], []
+        for _ in range(count):
+            text = block.text()
+            chars.append(len(text))
+            words.append(len(text.split()))
+            block = block.next()
+        return chars, words
+
+    def on_contents_change(self, position, removed, added):
+        """Recount only the blocks covered by an edit."""
+        document = self.document
+        end = min(position + added, document.characterCount() - 1)
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(end).blockNumber()
+        new_count = last - first + 1
+        old_count = new_count - (document.blockCount() - len(self.block_chars))
+        old_slice = slice(first, first + old_count)
+        chars, words = self.count_blocks(document.findBlockByNumber(first), new_count)
+        self.characters += sum(chars) - sum(self.block_chars[old_slice]) + new_count - old_count
+        self.words += sum(words) - sum(self.block_words[old_slice])
+        self.block_chars[old_slice] = chars
+        self.block_words[old_slice] = words
+        self.revision = document.revision()
+        self.changed.emit()
+
+class PreviewDocument:
+    """The preview's QTextDocument, kept as one frame per rendered Markdown block.
+
+    A render is diffed against the frames on screen by block key and only the
+    changed run of frames is rebuilt, so Qt re-lays out just those frames.
+    Frames are separated by zero-height blocks and carry their first block's
+    top margin, which lays them out exactly as one setHtml() would. Pasted
+    fragments do not carry the template's body rule, so it is applied to
+    the root frame and the default font instead.
+    """
+    def __init__(self, document):
+        self.document = document
+        self.scratch = QTextDocument()
+        self.stylesheet = None
+        self.body_format = QTextCharFormat()
+        self.keys = []
+        self.lines = []
+        self.frames = []
+        self.separator_format = QTextBlockFormat()
+        self.separator_format.setLineHeight(0, QTextBlockFormat.FixedHeight)
+
+    @staticmethod
+    def piece_at_line(lines, line):
+        """Return the index of the piece, given each piece's line count, holding source line (0-based)."""
+        return min(bisect.bisect_right(list(accumulate(lines)), line), len(lines) - 1)
+
+    def update(self, pieces, stylesheet, anchor_line=0):
+        """Show pieces, rebuilding only frames whose source changed.
+
+        Returns how far the frame rendered from anchor_line moved down, so
+        the caller can scroll to keep it in place.
+        """
+        if stylesheet != self.stylesheet:
+            self.stylesheet = stylesheet
+            self.document.setDefaultStyleSheet(stylesheet)
+            self.scratch.setDefaultStyleSheet(stylesheet)
+            self.scratch.setHtml('<body></body>')
+            self.body_format = self.scratch.begin().charFormat()
+            self.document.clear()
+            self.document.rootFrame().setFrameFormat(self.scratch.rootFrame().frameFormat())
+            self.keys, self.lines, self.frames = [], [], []
+        # QTextEdit resets its document's default font whenever the widget's font changes.
+        font = self.body_format.font().resolve(self.document.defaultFont())
+        if font != self.document.defaultFont():
+            self.document.setDefaultFont(font)
+        keys = [key for key, _, _ in pieces]
+        start = 0
+        limit = min(len(keys), len(self.keys))
+        while start < limit and keys[start] is not None and keys[start] == self.keys[start]:
+            start += 1
+        end = 0
+        while (end < limit - start and keys[-1 - end] is not None
+               and keys[-1 - end] == self.keys[-1 - end]):
+            end += 1
+        old_end, new_end = len(self.keys) - end, len(keys) - end
+        anchor = old_anchor = self.piece_at_line([lines for _, _, lines in pieces], anchor_line)
+        if anchor >= new_end:
+            old_anchor = anchor - new_end + old_end
+        elif anchor >= start:
+            old_anchor = start
+        layout = self.document.documentLayout()
+        anchor_top = layout.frameBoundingRect(self.frames[old_anchor]).top() if old_anchor < len(self.frames) else None
+        # Refill changed frames in place: removing a frame and inserting a new
+        # one where it was makes Qt re-lay out every frame above it.
+        reused = min(old_end, new_end)
+        cursor = QTextCursor(self.document)
+        cursor.beginEditBlock()
+        for index in range(start, reused):
+            self.fill_frame(cursor, self.frames[index], pieces[index][1], index)
+        frames = self.frames[start:reused]
+        if reused < old_end:
+            cursor.setPosition(self.frames[reused].firstPosition() - 1)
+            cursor.setPosition(self.frames[old_end - 1].lastPosition() + 1, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+        elif reused < new_end:
+            if reused < len(self.frames):
+                cursor.setPosition(self.frames[reused].firstPosition() - 1)
+            else:
+                cursor.movePosition(QTextCursor.End)
+            for index in range(reused, new_end):
+                cursor.setBlockFormat(self.separator_format)
+                frame = cursor.insertFrame(QTextFrameFormat())
+                self.fill_frame(cursor, frame, pieces[index][1], index)
+                frames.append(frame)
+                cursor.setPosition(frame.lastPosition() + 1)
+            cursor.setBlockFormat(self.separator_format)
+        self.keys[start:old_end] = keys[start:new_end]
+        self.lines[start:old_end] = [lines for _, _, lines in pieces[start:new_end]]
+        self.frames[start:old_end] = frames
+        if start == 0 and self.frames:
+            self.set_top_margin(self.frames[0], 0)
+        if 0 < new_end < len(self.frames):
+            self.set_top_margin(self.frames[new_end], new_end)
+        cursor.endEditBlock()
+        if anchor_top is None or anchor >= len(self.frames):
+            return 0
+        return layout.frameBoundingRect(self.frames[anchor]).top() - anchor_top
+
+    def fill_frame(self, cursor, frame, html, index):
+        """Replace a frame's contents with html."""
+        self.scratch.setHtml(html.strip())
+        cursor.setPosition(frame.firstPosition())
+        cursor.setPosition(frame.lastPosition(), QTextCursor.KeepAnchor)
+        cursor.insertFragment(QTextDocumentFragment(self.scratch))
+        first_format = self.scratch.begin().blockFormat()
+        QTextCursor(self.document.findBlock(frame.firstPosition())).setBlockFormat(first_format)
+        self.set_top_margin(frame, index)
+
+    def set_top_margin(self, frame, index):
+        """Give a frame its first block's top margin, which Qt ignores at the top of a frame."""
+        frame_format = frame.frameFormat()
+        first_block = self.document.findBlock(frame.firstPosition())
+        frame_format.setTopMargin(first_block.blockFormat().topMargin() if index else 0)
+        frame.setFrameFormat(frame_format)
+
+class HighlightedBlock(QTextBlockUserData):
+    """Marks a block whose formats are up to date, not just its fence state."""
+
+class MarkdownHighlighter(QSyntaxHighlighter):
+    """Markdown syntax highlighting that only formats blocks near the viewport.
+
+    A block's state records the code fence open at its end, so an edit
+    re-highlights only up to the next block whose state did not change.
+    Blocks away from the viewport get their state but no formats, and a
+    pass that runs over its time budget leaves the blocks it did not reach
+    to be finished from the event loop. Outside of an edit Qt re-lays out
+    the whole document for each block a QSyntaxHighlighter reformats, so
+    blocks scrolled into view are formatted here directly, all at once.
+
+    Qt highlights the whole of a document that already has text when a
+    highlighter is set on it, giving every block a layout, so the
+    highlighter should be made with its document, while it is empty. Text
+    that arrives before the document is laid out emits no contentsChange;
+    catch_up() works out its states from the event loop.
+    """
+    def __init__(self, document, editor):
+        super().__init__(document)
+        self.editor = editor
+        self.deadline = None
+        self.revision = None
+        self.first_block = self.last_block = -1
+        self.pending = None
+        self.pending_end = 0
+        self.pending_revision = None
+        self.resume_timer = QTimer(self)
+        self.resume_timer.setSingleShot(True)
+        self.resume_timer.timeout.connect(self.resume)
+        self.heading_format = QTextCharFormat()
+        self.heading_format.setFontWeight(QFont.Bold)
+        self.heading_format.setForeground(QColor("#1f4e9e"))
+        self.code_format = QTextCharFormat()
+        self.code_format.setForeground(QColor("#a3372b"))
+        self.code_format.setBackground(QColor("#e8e8e8"))
+        strong_format = QTextCharFormat()
+        strong_format.setFontWeight(QFont.Bold)
+        emphasis_format = QTextCharFormat()
+        emphasis_format.setFontItalic(True)
+        strikethrough_format = QTextCharFormat()
+        strikethrough_format.setFontStrikeOut(True)
+        link_format = QTextCharFormat()
+        link_format.setForeground(QColor("#0b6fc2"))
+        link_format.setFontUnderline(True)
+        # Later patterns win where they overlap, so code spans come last.
+        self.inline_formats = ((STRONG_RE, strong_format), (EMPHASIS_RE, emphasis_format),
+                               (STRIKETHROUGH_HIGHLIGHT_RE, strikethrough_format),
+                               (LINK_RE, link_format), (INLINE_CODE_RE, self.code_format))
+        self.revision = document.revision()
+
+    def catch_up(self):
+        """Queue states for text added without a contentsChange, such as a file loaded in the background."""
+        document = self.document()
+        if document.revision() != self.revision:
+            self.revision = document.revision()
+            self.defer(document.begin())
+
+    def begin_pass(self):
+        self.deadline = time.perf_counter() + HIGHLIGHT_BUDGET_MS / 1000
+        self.revision = self.document().revision()
+
+    def end_pass(self):
+        self.deadline = None
+
+    @staticmethod
+    def next_state(state, text):
+        """Return the state after a block of text given the state before it.
+
+        The state is 0 outside a code fence, otherwise the fence's length
+        shifted left by one with the low bit set for a tilde fence.
+        """
+        if state > 0:
+            match = FENCE_CLOSE_RE.match(text)
+            if match and match.group(1)[0] == '`~'[state & 1] and len(match.group(1)) >= state >> 1:
+                return 0
+            return state
+        match = FENCE_OPEN_RE.match(text)
+        if match:
+            return len(match.group(1)) << 1 | (match.group(1)[0] == '~')
+        return 0
+
+    def block_formats(self, state, text):
+        """Return non-overlapping (start, length, format) for a block of text given the state before it."""
+        if state > 0 or FENCE_OPEN_RE.match(text):
+            return [(0, len(text), self.code_format)]
+        if HEADING_RE.match(text):
+            return [(0, len(text), self.heading_format)]
+        spans = [(match.start(), match.end(), text_format) for pattern, text_format in self.inline_formats
+                 for match in pattern.finditer(text)]
+        if len(spans) < 2:
+            return [(start, end - start, text_format) for start, end, text_format in spans]
+        formats = [None] * len(text)
+        for start, end, text_format in spans:
+            formats[start:end] = [text_format] * (end - start)
+        ranges = []
+        start = 0
+        for text_format, run in groupby(formats):
+            length = len(list(run))
+            if text_format is not None:
+                ranges.append((start, length, text_format))
+            start += length
+        return ranges
+
+    def highlightBlock(self, text):
+        block = self.currentBlock()
+        revision = self.document().revision()
+        if self.deadline is None and self.revision == revision:
+            # Qt re-highlights everything when the document is shown again,
+            # though no text changed since the last pass.
+            self.keep(block)
+            return
+        if self.deadline is None or self.revision != revision:
+            self.begin_pass()
+            QTimer.singleShot(0, self.end_pass)
+        if time.perf_counter() > self.deadline:
+            self.keep(block)
+            self.defer(block)
+            return
+        state = self.previousBlockState()
+        self.setCurrentBlockState(self.next_state(state, text))
+        if self.first_block <= block.blockNumber() <= self.last_block:
+            for start, length, text_format in self.block_formats(state, text):
+                self.setFormat(start, length, text_format)
+            self.setCurrentBlockUserData(HighlightedBlock())
+        else:
+            self.setCurrentBlockUserData(None)
+
+    def keep(self, block):
+        """Leave block's state and formats as they were."""
+        self.setCurrentBlockState(block.userState())
+        if block.userData() is not None:
+            for format_range in block.layout().formats():
+                self.setFormat(format_range.start, format_range.length, format_range.format)
+
+    def defer(self, block):
+        """Queue block for the next pass.
+
+        The end of the queued blocks is kept as a position, which is only
+        trusted while the text has not changed since.
+        """
+        start = block.position()
+        end = start + block.length() - 1
+        if self.pending is None:
+            self.pending = QTextCursor(self.document())
+            self.pending.setPosition(start)
+            self.pending_end = end
+            self.resume_timer.start()
+        else:
+            if start < self.pending.position():
+                self.pending.setPosition(start)
+            if self.pending_revision != self.document().revision():
+                end = self.document().characterCount()
+            self.pending_end = max(self.pending_end, end)
+        self.pending_revision = self.document().revision()
+
+    def resume(self):
+        """Carry states on through the blocks an earlier pass ran out of time for.
+
+        Blocks after one whose state changes lose their formats, to be
+        formatted again when they are in view.
+        """
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        document = self.document()
+        end = self.pending_end if self.pending_revision == document.revision() else document.characterCount()
+        self.begin_pass()
+        block = document.findBlock(pending.position())
+        first = block.blockNumber()
+        state = block.previous().userState()
+        stale = block.previous().isValid()
+        while block.isValid():
+            if time.perf_counter() > self.deadline:
+                self.defer(block)
+                self.pending_end = max(self.pending_end, end)
+                break
+            next_state = self.next_state(state, block.text())
+            if next_state == block.userState() and block.position() > end:
+                break
+            # Blocks not reached yet (-1) are formatted as if outside a fence,
+            # so the next block keeps its formats if that turns out to be so.
+            if stale:
+                block.setUserData(None)
+            stale = max(block.userState(), 0) != next_state
+            block.setUserState(next_state)
+            state = next_state
+            block = block.next()
+        self.end_pass()
+        last = block.blockNumber() if block.isValid() else document.blockCount()
+        if first <= self.last_block and last >= self.first_block:
+            self.highlight_visible()
+
+    def highlight_visible(self):
+        """Format the blocks around the viewport that only have their state so far."""
+        editor = self.editor
+        document = self.document()
+        if editor.document() is not document:
+            return
+        first, last = editor.visible_blocks()
+        self.first_block = first - HIGHLIGHT_MARGIN_BLOCKS
+        self.last_block = last + HIGHLIGHT_MARGIN_BLOCKS
+        block = document.findBlockByNumber(max(self.first_block, 0))
+        start = end = None
+        for _ in range(self.last_block - max(self.first_block, 0) + 1):
+            if not block.isValid():
+                break
+            if block.userData() is None:
+                ranges = []
+                for range_start, length, text_format in self.block_formats(block.previous().userState(), block.text()):
+                    format_range = QTextLayout.FormatRange()
+                    format_range.start = range_start
+                    format_range.length = length
+                    format_range.format = text_format
+                    ranges.append(format_range)
+                block.layout().setFormats(ranges)
+                block.setUserData(HighlightedBlock())
+                if start is None:
+                    start = block.position()
+                end = block.position() + block.length()
+            block = block.next()
+        if start is not None:
+            document.markContentsDirty(start, end - start)
+
+def block_at(document, y, guess):
+    """Return the number of the block at height y in document, searching outward from block number guess.
+
+    Only blocks up to about twice as far from guess as the one found are
+    laid out for the search.
+    """
+    layout = document.documentLayout()
+
+    def top(number):
+        return layout.blockBoundingRect(document.findBlockByNumber(number)).top()
+
+    count = document.blockCount()
+    low = high = min(max(guess, 0), count - 1)
+    step = 1
+    if top(low) <= y:
+        high = low + 1
+        while high < count and top(high) <= y:
+            low, high = high, min(high + step, count)
+            step *= 2
+    else:
+        while low > 0 and top(low) > y:
+            high, low = low, max(low - step, 0)
+            step *= 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if top(middle) <= y:
+            low = middle
+        else:
+            high = middle
+    return low
 
 class MarkdownEditor(QTextEdit):
     """Custom text editor with markdown preview support."""
-    def __init__(self, parent=None):
+    # Relays the shown document's DocumentStats.changed.
+    stats_changed = pyqtSignal()
+
+    def __init__(self, parent=None, debounce_ms=PREVIEW_DEBOUNCE_MS):
         super().__init__(parent)
         self.preview = QTextEdit()
         self.preview.setReadOnly(True)
         self.preview.setObjectName("preview")
-        self.textChanged.connect(self.update_preview)
-        
-    def update_preview(self):
-        """Update the markdown preview when text changes."""
-        # Save scroll position
-        scrollbar = self.preview.verticalScrollBar()
-        current_scroll = scrollbar.value()
-        
-        # Set markdown extensions
-        extensions = [
-            'fenced_code',
-            'tables', 
-            'nl2br',
-            'abbr',
-            'attr_list',
-            'def_list',
-            'footnotes',
-            'md_in_html',
-            'sane_lists',
-            'smarty',
-            'toc',
-            'extra',
-            CodeHiliteExtension(css_class='codehilite', noclasses=True, pygments_style='monokai')
-        ]
-        
-        md = markdown.Markdown(extensions=extensions)
-        html = md.convert(self.toPlainText())
-        
-        # Special conversion for strikethrough text
-        html = html.replace('~~', '<s>')
-        html = html.replace('~~', '</s>')
-        
-        # Convert single quotes to monospace
-        import re
-        pattern = r"'([^']+)'"  # Tek tırnak içindeki metni yakala
-        html = re.sub(pattern, r'<span class="monospace">\1</span>', html)
-        
-        # Add quotation marks and indent blockquotes
-        html = html.replace('<blockquote>', '<blockquote><span style="display: inline-block; margin-left: 20px;">"')
-        html = html.replace('</blockquote>', '"</span></blockquote>')
-        
-        # Get HTML template from style.css
-        css_file_path = os.path.join(os.path.dirname(__file__), 'style.css')
-        if getattr(sys, 'frozen', False):
-            css_file_path = os.path.join(sys._MEIPASS, 'style.css')
-        
+        self.preview_revision = 0
+        self.preview_document = PreviewDocument(self.preview.document())
+        self.preview_cursor_line = 0
+        self.renderer = PreviewRenderer()
+        self.renderer.pieces_ready.connect(self.apply_preview)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(debounce_ms)
+        self.preview_timer.timeout.connect(self.update_preview)
+        self.textChanged.connect(self.schedule_preview)
+        self.stats = DocumentStats(self.document(), self.document())
+        self.stats.changed.connect(self.stats_changed)
+        self.highlighter = MarkdownHighlighter(self.document(), self)
+        self.history = None
+        self.first_visible_block = 0
+        self.verticalScrollBar().valueChanged.connect(self.highlight_visible)
+
+    def show_document(self, document):
+        """Edit another document; the previous one is left to its owner."""
+        document.setDefaultFont(self.font())
+        # Laying a document out for the first time reports all of its text as
+        # changed, which would highlight every block; its states are worked
+        # out by catch_up() instead.
+        document.blockSignals(True)
+        document.documentLayout()
+        document.blockSignals(False)
+        self.highlighter = None
+        self.setDocument(document)
         try:
-            with open(css_file_path, 'r') as css_file:
-                css_content = css_file.read()
-                # Extract HTML template from CSS comments
-                template_start = css_content.find('/* ===== BEGIN_MARKDOWN_TEMPLATE =====\n')
-                template_end = css_content.find('===== END_MARKDOWN_TEMPLATE =====\n*/')
-                if template_start != -1 and template_end != -1:
-                    html_template = css_content[template_start + 37:template_end].strip()
-                    # Replace {content} placeholder with actual HTML
-                    html_template = html_template.replace('{content}', html)
-                else:
-                    raise FileNotFoundError("HTML template not found in style.css")
-        except Exception as e:
-            print(f"Error loading HTML template: {e}")
+            self.stats.changed.disconnect(self.stats_changed)
+        except (TypeError, RuntimeError):
+            pass
+        self.stats = document.findChild(DocumentStats) or DocumentStats(document, document)
+        self.stats.changed.connect(self.stats_changed)
+        self.stats.catch_up()
+        self.highlighter = document.findChild(MarkdownHighlighter) or MarkdownHighlighter(document, self)
+        self.highlighter.catch_up()
+        self.history = document.findChild(UndoHistory)
+        self.highlight_visible()
+        self.schedule_preview()
+
+    def undo(self):
+        """Undo through the document's UndoHistory, which replaces Qt's undo stack."""
+        if self.history is not None and not self.isReadOnly():
+            self.move_after_undo(self.history.undo())
+
+    def redo(self):
+        if self.history is not None and not self.isReadOnly():
+            self.move_after_undo(self.history.redo())
+
+    def move_after_undo(self, position):
+        if position is not None:
+            cursor = self.textCursor()
+            cursor.setPosition(min(position, self.document().characterCount() - 1))
+            self.setTextCursor(cursor)
+            self.ensureCursorVisible()
+
+    def expecting_edit(self, start=None, end=None, step=None):
+        """Return a context manager under which an edit to the selection, or start to end, is undoable."""
+        if self.history is None:
+            return nullcontext()
+        cursor = self.textCursor()
+        return self.history.expecting(cursor.selectionStart() if start is None else start,
+                                      cursor.selectionEnd() if end is None else end, step)
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Undo):
+            self.undo()
+        elif event.matches(QKeySequence.Redo):
+            self.redo()
+        elif event.key() in NAVIGATION_KEYS:
+            super().keyPressEvent(event)
+        else:
+            with self.expecting_edit():
+                super().keyPressEvent(event)
+
+    def inputMethodEvent(self, event):
+        with self.expecting_edit():
+            super().inputMethodEvent(event)
+
+    def insertFromMimeData(self, source):
+        with self.expecting_edit():
+            super().insertFromMimeData(source)
+
+    def cut(self):
+        with self.expecting_edit():
+            super().cut()
+
+    def dropEvent(self, event):
+        """Drop as QTextEdit does; a move takes the selection out and puts it in at the drop position."""
+        position = self.cursorForPosition(event.pos()).position()
+        cursor = self.textCursor()
+        with self.expecting_edit(min(position, cursor.selectionStart()), max(position, cursor.selectionEnd())):
+            super().dropEvent(event)
+
+    def contextMenuEvent(self, event):
+        """Show the standard context menu with Undo and Redo going through the UndoHistory."""
+        menu = self.createStandardContextMenu(event.pos())
+        for name, slot, available in (('edit-undo', self.undo, self.history and self.history.steps['undo']),
+                                      ('edit-redo', self.redo, self.history and self.history.steps['redo'])):
+            action = menu.findChild(QAction, name)
+            if action is not None:
+                action.triggered.disconnect()
+                action.triggered.connect(slot)
+                action.setEnabled(bool(available) and not self.isReadOnly())
+        with self.expecting_edit():
+            menu.exec_(event.globalPos())
+        menu.deleteLater()
+
+    def visible_blocks(self):
+        """Return the numbers of the first and last blocks in the viewport.
+
+        cursorForPosition() walks the document from its first block, which
+        takes a noticeable time on long documents, so the blocks are looked
+        up near the ones found last time instead.
+        """
+        top = self.verticalScrollBar().value()
+        first = block_at(self.document(), top, self.first_visible_block)
+        last = block_at(self.document(), top + self.viewport().height(), first)
+        self.first_visible_block = first
+        return first, last
+
+    def highlight_visible(self):
+        """Bring syntax highlighting up to date around the viewport."""
+        if self.highlighter is not None:
+            self.highlighter.highlight_visible()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.highlight_visible()
+
+    def set_preview_debounce(self, debounce_ms):
+        """Change how long typing must pause before the preview re-renders."""
+        self.preview_timer.setInterval(debounce_ms)
+
+    def schedule_preview(self):
+        """Coalesce keystrokes into a single render once typing pauses."""
+        if self.preview.isVisible():
+            self.preview_timer.start()
+
+    def update_preview(self):
+        """Hand the current text to the render thread."""
+        self.preview_timer.stop()
+        self.preview_revision += 1
+        with tracer.span('preview snapshot', 'preview'):
+            text = self.toPlainText()
+        self.preview_cursor_line = self.textCursor().blockNumber()
+        self.renderer.request(self.preview_revision, text)
+
+    def apply_preview(self, revision, pieces):
+        """Patch the rendered pieces into the preview if they belong to the latest revision.
+
+        The preview is scrolled so the frame rendered from the source block
+        under the editor cursor stays where it was on screen.
+        """
+        if revision != self.preview_revision:
             return
-        
-        self.preview.setHtml(html_template)
-        
-        # Restore scroll position
-        scrollbar.setValue(current_scroll)
+        template = get_style_resources().template()
+        if template is None:
+            return
+        from markdown_preview import template_stylesheet
+        scrollbar = self.preview.verticalScrollBar()
+        scroll = scrollbar.value()
+        with tracer.span('patch preview', 'preview', pieces=len(pieces)):
+            shift = self.preview_document.update(pieces, template_stylesheet(template), self.preview_cursor_line)
+        scrollbar.setValue(int(scroll + shift))
 
 class FileHandler(QThread):
-    """Thread for handling file operations."""
+    """Thread that streams a file from disk into the editor."""
     file_content_loaded = pyqtSignal(str, str)
-    file_saved = pyqtSignal(bool)
+    load_progress = pyqtSignal(int, int)
+    load_finished = pyqtSignal(str, bool)
+    load_failed = pyqtSignal(str)
+    large_file_opened = pyqtSignal(object, str)
+    chunk_size = 1024 * 1024
+    chunks_in_flight = 4
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, large_file=False):
         super().__init__()
         self.file_path = file_path
+        self.large_file = large_file
+        self.chunk_slots = threading.Semaphore(self.chunks_in_flight)
+        self.bytes_read = 0
+        self.file_identity = None
+
+    def detect_encoding(self):
+        """Detect the encoding of the file, defaulting to UTF-8."""
+        return detect_encoding(self.file_path)
+
+    def chunk_consumed(self):
+        """Let the reader queue another chunk once the GUI has inserted one."""
+        self.chunk_slots.release()
+
+    def wait_for_chunk_slot(self):
+        """Block until a chunk may be emitted; False if loading was cancelled."""
+        while not self.chunk_slots.acquire(timeout=0.1):
+            if self.isInterruptionRequested():
+                return False
+        return not self.isInterruptionRequested()
 
     def run(self):
-        """Read the content of the file with encoding detection and incremental loading."""
-        detector = chardet.universaldetector.UniversalDetector()
+        """Stream the file as decoded chunks, emitting only the new text each time.
+
+        At most chunks_in_flight chunks wait in the GUI event queue, so memory
+        stays close to the one copy held by the document.
+        """
         try:
+            with tracer.span('detect encoding', 'file'):
+                encoding = self.detect_encoding()
+            if self.large_file and not encoding.lower().startswith(WIDE_ENCODINGS):
+                self.index_large_file(encoding)
+                return
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder(encoding)(errors='replace'), translate=True)
+            total = os.path.getsize(self.file_path)
+            bytes_read = 0
+            cancelled = False
             with open(self.file_path, 'rb') as file:
-                while chunk := file.read(1024):
-                    detector.feed(chunk)
-                    if detector.done:
-                        break
-                detector.close()
-            encoding = detector.result['encoding'] or 'utf-8'
-            with open(self.file_path, 'r', encoding=encoding, errors='replace') as file:
-                content = ""
-                chunk_size = 1024 * 1024
-                while chunk := file.read(chunk_size):
-                    content += chunk
-                    self.file_content_loaded.emit(content, encoding)
-            self.file_content_loaded.emit(content, encoding)
+                stat = os.fstat(file.fileno())
+                self.file_identity = (stat.st_dev, stat.st_ino)
+                while chunk := file.read(self.chunk_size):
+                    bytes_read += len(chunk)
+                    with tracer.span('decode chunk', 'file', bytes=len(chunk)):
+                        text = decoder.decode(chunk)
+                    if text:
+                        if not self.wait_for_chunk_slot():
+                            cancelled = True
+                            break
+                        self.file_content_loaded.emit(text, encoding)
+                    self.load_progress.emit(bytes_read, bytes_read * 100 // total if total else 100)
+            self.bytes_read = bytes_read
+            if not cancelled:
+                text = decoder.decode(b'', final=True)
+                if text and self.wait_for_chunk_slot():
+                    self.file_content_loaded.emit(text, encoding)
+            self.load_finished.emit(encoding, cancelled or self.isInterruptionRequested())
+        except Exception as e:
+            self.load_failed.emit(f"Error reading file: {e}")
+
+    def index_large_file(self, encoding):
+        """Map the file read-only and index its lines instead of decoding it."""
+        with open(self.file_path, 'rb') as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        index = LineIndex(mapping)
+        self.large_file_opened.emit(index, encoding)
+        total = len(mapping)
+        with tracer.span('index lines', 'file', bytes=total):
+            index.build(self.isInterruptionRequested,
+                        lambda offset: self.load_progress.emit(offset, offset * 100 // total))
+        self.load_finished.emit(encoding, not index.complete)
+
+class FileSaver(QThread):
+    """Thread that writes a text snapshot to disk atomically.
+
+    The text is encoded in chunks into a temporary file next to the target,
+    fsynced and renamed over it, so a crash mid-save never truncates the
+    original. Reports through file_saved(success, error, seconds).
+    """
+    file_saved = pyqtSignal(bool, str, float)
+    encoding_failed = pyqtSignal(str)
+    chunk_size = FileHandler.chunk_size
+
+    def __init__(self, file_path, content, encoding):
+        super().__init__()
+        self.file_path = file_path
+        self.content = content
+        self.encoding = encoding
+        self.succeeded = False
+
+    def run(self):
+        started = time.perf_counter()
+        target = os.path.realpath(self.file_path)
+        directory = os.path.dirname(target)
+        temp_path = None
+        try:
+            mode = os.stat(target).st_mode & 0o7777 if os.path.exists(target) else NEW_FILE_MODE
+            fd, temp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(target)}.', suffix='.tmp', dir=directory)
+            encoder = codecs.getincrementalencoder(self.encoding)()
+            with os.fdopen(fd, 'wb') as file:
+                with tracer.span('encode and write', 'save', length=len(self.content)):
+                    for start in range(0, len(self.content), self.chunk_size):
+                        chunk = self.content[start:start + self.chunk_size]
+                        if os.linesep != '\n':
+                            chunk = chunk.replace('\n', os.linesep)
+                        file.write(encoder.encode(chunk))
+                    file.write(encoder.encode('', final=True))
+                    file.flush()
+                with tracer.span('fsync', 'save'):
+                    os.fsync(file.fileno())
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, target)
+            temp_path = None
+            if hasattr(os, 'O_DIRECTORY'):
+                directory_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(directory_fd)
+                finally:
+                    os.close(directory_fd)
+            self.succeeded = True
+            self.file_saved.emit(True, '', time.perf_counter() - started)
+        except UnicodeEncodeError:
+            self.encoding_failed.emit(self.encoding)
         except Exception as e:
-            self.file_content_loaded.emit(f"Error reading file: {e}", '')
+            self.file_saved.emit(False, str(e), time.perf_counter() - started)
+        finally:
+            self.content = None
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+class RecoveryJournal(QObject):
+    """Append-only log of a document's unsaved edits, replayed after a crash.
+
+    Each edit is recorded from contentsChange as [position, removed, inserted]
+    and the records are appended to the log together, with one fsync, at most
+    every JOURNAL_COMMIT_MS. The log applies to a base: the file as it was
+    opened, or nothing for a new document. Once a log grows past
+    JOURNAL_COMPACT_BYTES the document is written out as a snapshot, which
+    becomes the base for a new log generation. Nothing touches the disk until
+    the first edit, and a QLockFile marks the journal as owned by a live
+    process.
+    """
+    def __init__(self, document, file_path=None, encoding="UTF-8", directory=RECOVERY_DIR, header=None, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.document = document
+        self.pending = []
+        self.log_bytes = 0
+        self.snapshot_saver = None
+        self.revision = document.revision()
+        if header is None:
+            header = {'id': uuid.uuid4().hex, 'file': file_path, 'encoding': encoding, 'generation': 0,
+                      'base': 'file' if file_path else 'empty'}
+            if file_path:
+                stat = os.stat(file_path)
+                header.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        self.header = header
+        self.generation = header['generation']
+        self.lock = QLockFile(self.path('lock'))
+        self.lock.setStaleLockTime(0)
+        self.commit_timer = QTimer(self)
+        self.commit_timer.setSingleShot(True)
+        self.commit_timer.setInterval(JOURNAL_COMMIT_MS)
+        self.commit_timer.timeout.connect(self.commit)
+        document.contentsChange.connect(self.record)
+
+    def path(self, kind, generation=None):
+        name = self.header['id'] if generation is None else f"{self.header['id']}.{generation}"
+        return os.path.join(self.directory, f"{name}.{kind}")
+
+    def record(self, position, removed, added):
+        """Queue one edit; layout and format-only changes leave the revision alone and are skipped."""
+        revision = self.document.revision()
+        if revision == self.revision:
+            return
+        self.revision = revision
+        cursor = QTextCursor(self.document)
+        cursor.setPosition(position)
+        cursor.setPosition(min(position + added, self.document.characterCount() - 1), QTextCursor.KeepAnchor)
+        self.pending.append([position, removed, cursor.selectedText().replace('\u2029', '\n')])
+        if not self.commit_timer.isActive():
+            self.commit_timer.start()
+
+    def commit(self):
+        """Append the queued edits to the log and sync them to disk."""
+        self.commit_timer.stop()
+        if not self.pending:
+            return
+        with tracer.span('journal commit', 'journal', edits=len(self.pending)):
+            data = ''.join(json.dumps(edit, ensure_ascii=False) + '\n' for edit in self.pending).encode('utf-8')
+            self.pending = []
+            try:
+                if not self.lock.isLocked():
+                    os.makedirs(self.directory, exist_ok=True)
+                    self.lock.tryLock(0)
+                    self.write_header()
+                with open(self.path('log', self.generation), 'ab') as log:
+                    log.write(data)
+                    log.flush()
+                    os.fsync(log.fileno())
+            except OSError as e:
+                print(f"Could not write the recovery journal: {e}")
+                return
+        self.log_bytes += len(data)
+        if self.log_bytes > JOURNAL_COMPACT_BYTES and self.snapshot_saver is None:
+            self.compact()
+
+    def compact(self):
+        """Start a new log generation based on a snapshot of the document."""
+        self.generation += 1
+        self.log_bytes = 0
+        with tracer.span('journal snapshot', 'journal'):
+            content = self.document.toRawText().replace('\u2029', '\n')
+        self.snapshot_saver = FileSaver(self.path('snapshot', self.generation), content, 'utf-8')
+        self.snapshot_saver.file_saved.connect(self.snapshot_written)
+        self.snapshot_saver.finished.connect(self.snapshot_finished)
+        self.snapshot_saver.start()
+
+    def snapshot_written(self, success, error, elapsed):
+        """Rebase the journal on the new snapshot and drop what it replaces."""
+        if self.sender() is not self.snapshot_saver or not success:
+            return
+        self.header.update(base='snapshot', generation=self.generation)
+        try:
+            self.write_header()
+            for path in self.files():
+                if not path.endswith(('.json', '.lock')) and int(path.rsplit('.', 2)[-2]) < self.generation:
+                    os.remove(path)
+        except OSError as e:
+            print(f"Could not compact the recovery journal: {e}")
+
+    def snapshot_finished(self):
+        if self.sender() is self.snapshot_saver:
+            self.snapshot_saver = None
+
+    def write_header(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.journal-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(self.header, file)
+        os.replace(temp_path, self.path('json'))
+
+    def files(self):
+        return glob.glob(os.path.join(glob.escape(self.directory), glob.escape(self.header['id']) + '.*'))
+
+    def edits(self):
+        """Yield the logged edits that apply on top of the journal's base."""
+        logs = []
+        for path in self.files():
+            if path.endswith('.log') and int(path.rsplit('.', 2)[-2]) >= self.header['generation']:
+                logs.append((int(path.rsplit('.', 2)[-2]), path))
+        for _, path in sorted(logs):
+            with open(path, encoding='utf-8') as log:
+                for line in log:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        return
+
+    def base_path(self):
+        """Return the file to load before replaying, None for an empty base; raises ValueError if it is gone or changed."""
+        if self.header['base'] == 'snapshot':
+            return self.path('snapshot', self.header['generation'])
+        if self.header['base'] == 'empty':
+            return None
+        stat = os.stat(self.header['file'])
+        if (stat.st_size, stat.st_mtime_ns) != (self.header['size'], self.header['mtime_ns']):
+            raise ValueError(f"{self.header['file']} has changed since the unsaved edits were made")
+        return self.header['file']
+
+    def replay(self, document):
+        """Apply the logged edits to document, loaded from base_path(), as one undoable step."""
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        for position, removed, inserted in self.edits():
+            end = document.characterCount() - 1
+            cursor.setPosition(min(position, end))
+            cursor.setPosition(min(position + removed, end), QTextCursor.KeepAnchor)
+            cursor.insertText(inserted)
+        cursor.endEditBlock()
+
+    def follow(self, document):
+        """Keep logging edits to document, which now holds the replayed text."""
+        self.document.contentsChange.disconnect(self.record)
+        self.document = document
+        self.revision = document.revision()
+        document.contentsChange.connect(self.record)
+        self.log_bytes = sum(os.path.getsize(path) for path in self.files() if path.endswith('.log'))
+        self.generation = max([self.header['generation']] +
+                              [int(path.rsplit('.', 2)[-2]) for path in self.files() if path.endswith('.log')])
+
+    def discard(self):
+        """Stop journaling and delete the journal's files."""
+        self.commit_timer.stop()
+        self.pending = []
+        try:
+            self.document.contentsChange.disconnect(self.record)
+        except (TypeError, RuntimeError):
+            pass
+        if self.snapshot_saver:
+            self.snapshot_saver.wait()
+        try:
+            for path in self.files():
+                if not path.endswith('.lock'):
+                    os.remove(path)
+        except OSError as e:
+            print(f"Could not remove the recovery journal: {e}")
+        self.lock.unlock()
+        self.deleteLater()
+
+    @classmethod
+    def abandoned(cls, directory=RECOVERY_DIR):
+        """Return journals left behind by Scratchpads that are no longer running, locking each."""
+        journals = []
+        for header_path in sorted(glob.glob(os.path.join(glob.escape(directory), '*.json'))):
+            try:
+                with open(header_path, encoding='utf-8') as file:
+                    header = json.load(file)
+            except (OSError, ValueError):
+                continue
+            journal = cls(QTextDocument(), directory=directory, header=header)
+            journal.document.setParent(journal)
+            if journal.lock.tryLock(0):
+                journals.append(journal)
+            else:
+                journal.deleteLater()
+        return journals
+
+def utf16_length(text):
+    """Length of text in QTextDocument positions, where astral characters count twice."""
+    if text.isascii():
+        return len(text)
+    return len(text) + len(ASTRAL_CHAR_RE.findall(text))
+
+def utf16_slice(text, start, end):
+    """Return the part of text between QTextDocument positions start and end."""
+    if text.isascii():
+        return text[start:end]
+    return text.encode('utf-16-le', 'surrogatepass')[2 * start:2 * end].decode('utf-16-le', 'surrogatepass')
+
+def utf16_index(text, position):
+    """Return the index into text of QTextDocument position position."""
+    if text.isascii():
+        return position
+    return len(utf16_slice(text, 0, position))
+
+def text_fingerprint(document):
+    return hashlib.blake2b(document.toRawText().encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+def common_prefix_length(a, b):
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def common_suffix_length(a, b):
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+class UndoStep:
+    """One undoable edit, as hunks of text removed and inserted at positions in the text before it.
+
+    The hunks' texts are concatenated and their positions and lengths packed
+    into arrays, so an edit made of many small changes stays compact.
+    """
+    def __init__(self, positions, removed_lengths, inserted_lengths, removed, inserted):
+        self.positions = positions
+        self.removed_lengths = removed_lengths
+        self.inserted_lengths = inserted_lengths
+        self.removed = removed
+        self.inserted = inserted
+
+    @classmethod
+    def diff(cls, start, old_lines, new_lines):
+        """Build the step that turns the blocks old_lines, at document position start, into new_lines.
+
+        Changed lines are paired off one to one where the line count did not
+        change, as with most Replace All edits, and otherwise matched with
+        difflib, so only the runs of lines that changed are kept. Each run is
+        trimmed to the characters that differ.
+        """
+        head = 0
+        count = min(len(old_lines), len(new_lines))
+        while head < count and old_lines[head] == new_lines[head]:
+            head += 1
+        tail = 0
+        while tail < count - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+            tail += 1
+        old_end, new_end = len(old_lines) - tail, len(new_lines) - tail
+        matches = [(0, 0, head)]
+        if old_end != new_end and 1 < old_end - head <= UNDO_DIFF_MAX_LINES and 1 < new_end - head <= UNDO_DIFF_MAX_LINES:
+            from difflib import SequenceMatcher
+            matcher = SequenceMatcher(None, old_lines[head:old_end], new_lines[head:new_end])
+            matches += [(head + i, head + j, size) for i, j, size in matcher.get_matching_blocks()[:-1]]
+        matches += [(old_end, new_end, tail), (len(old_lines), len(new_lines), 0)]
+        offsets = list(accumulate((utf16_length(line) + 1 for line in old_lines), initial=start))
+        positions, removed_lengths, inserted_lengths = array('q'), array('q'), array('q')
+        removed, inserted = [], []
+
+        def add(position, old, new):
+            prefix = common_prefix_length(old, new)
+            if prefix:
+                position += utf16_length(old[:prefix])
+                old, new = old[prefix:], new[prefix:]
+            suffix = common_suffix_length(old, new)
+            if suffix:
+                old, new = old[:-suffix], new[:-suffix]
+            if old or new:
+                positions.append(position)
+                removed.append(old)
+                inserted.append(new)
+                removed_lengths.append(len(old))
+                inserted_lengths.append(len(new))
+
+        # Between matched runs, changed lines are paired off one to one where
+        # the counts agree; otherwise the run and its line breaks is one hunk.
+        old_gap = new_gap = 0
+        for i, j, size in matches:
+            if i - old_gap == j - new_gap:
+                for line in range(old_gap, i):
+                    add(offsets[line], old_lines[line], new_lines[line - old_gap + new_gap])
+            else:
+                add(offsets[old_gap] - 1 if old_gap else start,
+                    '\n'.join([''] * (old_gap > 0) + old_lines[old_gap:i] + [''] * (i < len(old_lines))),
+                    '\n'.join([''] * (new_gap > 0) + new_lines[new_gap:j] + [''] * (j < len(new_lines))))
+            old_gap, new_gap = i + size, j + size
+        return cls(positions, removed_lengths, inserted_lengths, ''.join(removed), ''.join(inserted))
+
+    @classmethod
+    def replacements(cls, positions, removed, inserted):
+        """Build the step that replaces each text in removed, at the matching position, with the one in inserted."""
+        return cls(array('q', positions), array('q', map(len, removed)), array('q', map(len, inserted)),
+                   ''.join(removed), ''.join(inserted))
+
+    def hunks(self):
+        """Yield (position, removed, inserted) for each hunk, in document order."""
+        removed_at = inserted_at = 0
+        for position, removed_length, inserted_length in zip(self.positions, self.removed_lengths,
+                                                             self.inserted_lengths):
+            yield (position, self.removed[removed_at:removed_at + removed_length],
+                   self.inserted[inserted_at:inserted_at + inserted_length])
+            removed_at += removed_length
+            inserted_at += inserted_length
+
+    def inverse(self):
+        """Return the step that takes this one back, with positions in the text after it."""
+        positions = array('q')
+        shift = 0
+        for position, removed, inserted in self.hunks():
+            positions.append(position + shift)
+            shift += utf16_length(inserted) - utf16_length(removed)
+        return UndoStep(positions, self.inserted_lengths, self.removed_lengths, self.inserted, self.removed)
+
+    def merge(self, step):
+        """Fold step, made right after this one, in if both just type or delete at the same spot; True if merged."""
+        if (len(self.positions) != 1 or len(step.positions) != 1
+                or any('\n' in text for text in (self.removed, self.inserted, step.removed, step.inserted))):
+            return False
+        position, next_position = self.positions[0], step.positions[0]
+        if not step.removed and next_position == position + utf16_length(self.inserted):
+            self.inserted += step.inserted
+        elif self.inserted or step.inserted:
+            return False
+        elif next_position == position:
+            self.removed += step.removed
+        elif next_position + utf16_length(step.removed) == position:
+            self.positions[0] = next_position
+            self.removed = step.removed + self.removed
+        else:
+            return False
+        self.removed_lengths[0], self.inserted_lengths[0] = len(self.removed), len(self.inserted)
+        return True
+
+    def size(self):
+        """Rough bytes held in memory by the step."""
+        return (sys.getsizeof(self.removed) + sys.getsizeof(self.inserted)
+                + 3 * self.positions.itemsize * len(self.positions) + UNDO_STEP_OVERHEAD)
+
+class UndoHistory(QObject):
+    """Undo and redo for a document, kept within a memory cap.
+
+    The document's own undo stack is turned off. Each edit, or edit block
+    such as Replace All, is recorded from contentsChange as one UndoStep.
+    That signal comes once the text is gone, so the text an edit can
+    remove is read just before it, inside expecting(); an edit that removes
+    text nobody expected can't be taken back and clears the history.
+    Continued typing or deleting is merged into one step, as Qt does. Once
+    the steps in memory pass UNDO_MEMORY_MB, those furthest from the present
+    are compressed into a temporary file and read back when undo or redo
+    reaches them.
+    """
+    def __init__(self, document, limit=UNDO_MEMORY_MB * 1024 * 1024):
+        super().__init__(document)
+        self.limit = limit
+        self.steps = {'undo': [], 'redo': []}
+        # Spilled steps are the bottom of each stack, replaced by their place in the spill file.
+        self.spilled = {'undo': 0, 'redo': 0}
+        self.memory = 0
+        self.clean = None
+        # Edits that changed the text, and how many had been made when the document was last clean.
+        self.changes = 0
+        self.clean_changes = 0
+        self.tracking = True
+        self.applying = False
+        # (position, text) read by expecting(), or the UndoStep it was given.
+        self.expected = None
+        self.spill_file = None
+        self.spilled_bytes = 0
+        self.released = None
+        self.attach(document)
+
+    def attach(self, document):
+        """Start keeping the history of document, which must hold the text the steps lead to."""
+        self.document = document
+        self.setParent(document)
+        document.setUndoRedoEnabled(False)
+        self.revision = document.revision()
+        self.characters = document.characterCount()
+        if not document.isModified():
+            self.on_modification_changed(False)
+        document.contentsChange.connect(self.on_contents_change)
+        document.contentsChanged.connect(self.on_contents_changed)
+        document.modificationChanged.connect(self.on_modification_changed)
+
+    def release(self):
+        """Let go of the document, spilling the history to disk.
+
+        A fingerprint of the text is kept, so the history survives the
+        document being released and read back in unchanged.
+        """
+        self.document.contentsChange.disconnect(self.on_contents_change)
+        self.document.contentsChanged.disconnect(self.on_contents_changed)
+        self.document.modificationChanged.disconnect(self.on_modification_changed)
+        self.released = text_fingerprint(self.document)
+        self.setParent(None)
+        self.document = None
+        limit, self.limit = self.limit, 0
+        self.trim()
+        self.limit = limit
+
+    def reattach(self, document):
+        """Pick up a released history on the document read back in to replace the released one.
+
+        If the text is not what it was, as when the file changed on disk
+        meanwhile, the steps no longer apply and the history starts over.
+        """
+        if text_fingerprint(document) != self.released:
+            self.clear()
+        self.released = None
+        self.attach(document)
+
+    @contextmanager
+    def expecting(self, start=0, end=None, step=None):
+        """Read the text that an edit made in the with block can remove, from the block before start to the one after end.
+
+        If step is given, it is recorded for the edit instead. Text read by
+        an enclosing with block is kept.
+        """
+        if self.expected is not None:
+            yield
+            return
+        if step is None:
+            document = self.document
+            first = document.findBlock(start)
+            last = document.findBlock(document.characterCount() - 1 if end is None else end)
+            if first.previous().isValid():
+                first = first.previous()
+            if last.next().isValid():
+                last = last.next()
+            cursor = QTextCursor(document)
+            cursor.setPosition(first.position())
+            cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+            self.expected = (first.position(), cursor.selectedText())
+        else:
+            self.expected = step
+        try:
+            yield
+        finally:
+            self.expected = None
+
+    def on_modification_changed(self, modified):
+        """Note the step the document was last clean at.
+
+        With Qt's undo off, any edit block, even an empty one, marks the
+        document modified; that is taken back if the text has not changed.
+        """
+        if not modified:
+            self.clean = len(self.steps['undo'])
+            self.clean_changes = self.changes
+        elif self.changes == self.clean_changes and self.document.characterCount() == self.characters:
+            self.document.setModified(False)
+
+    def on_contents_changed(self):
+        """Catch edits that emitted no contentsChange, as edits to a document not yet laid out don't.
+
+        Untracked text added at the end keeps the history; anything else can't be taken back.
+        """
+        self.revision = self.document.revision()
+        characters = self.document.characterCount()
+        if characters != self.characters:
+            self.expected = None
+            if self.tracking or characters < self.characters:
+                self.clear()
+            self.characters = characters
+            self.changes += 1
+
+    def on_contents_change(self, position, removed, added):
+        """Record the edit, taking the text it removed from what expecting() read."""
+        document = self.document
+        revision = document.revision()
+        if revision == self.revision:
+            return
+        self.revision = revision
+        expected, self.expected = self.expected, None
+        characters, self.characters = self.characters, document.characterCount()
+        # A span reaching the end of the document counts the final block
+        # separator, which is never removed.
+        excess = position + added - (self.characters - 1)
+        if excess > 0:
+            removed -= excess
+            added -= excess
+        if self.applying or isinstance(expected, UndoStep) or not self.tracking:
+            self.changes += 1
+            if isinstance(expected, UndoStep) and not self.applying:
+                self.push(expected)
+            elif not self.tracking and (removed or position != characters - 1):
+                # Only text added at the end leaves every step's positions valid.
+                self.clear()
+            return
+        old = self.removed_text(expected, position, removed)
+        if added - removed != self.characters - characters:
+            old = None
+        if old is None:
+            self.changes += 1
+            self.clear()
+            return
+        cursor = QTextCursor(document)
+        cursor.setPosition(position)
+        cursor.setPosition(position + added, QTextCursor.KeepAnchor)
+        new = cursor.selectedText()
+        if old == new:
+            self.expected = expected
+            return
+        self.changes += 1
+        with tracer.span('record undo step', 'editor', length=added):
+            self.push(UndoStep.diff(position, old.split('\u2029'), new.split('\u2029')))
+
+    @staticmethod
+    def removed_text(expected, position, removed):
+        """Return the removed characters from the text expecting() read, or None if it did not read them."""
+        if not removed:
+            return ''
+        if not isinstance(expected, tuple):
+            return None
+        start, text = expected
+        if position < start or position + removed - start > utf16_length(text):
+            return None
+        return utf16_slice(text, position - start, position + removed - start)
+
+    def push(self, step):
+        """Make step the latest undoable one, merging it into the previous step when it continues it."""
+        if not step.positions:
+            return
+        self.drop('redo')
+        undo_steps = self.steps['undo']
+        if self.clean is not None and self.clean > len(undo_steps):
+            self.clean = None
+        top = undo_steps[-1] if undo_steps else None
+        if isinstance(top, UndoStep) and self.clean != len(undo_steps):
+            size = top.size()
+            if top.merge(step):
+                self.memory += top.size() - size
+                self.trim()
+                return
+        undo_steps.append(step)
+        self.memory += step.size()
+        self.trim()
+
+    def undo(self):
+        """Take back the latest step; returns the position to put the cursor at, or None if there was none."""
+        if not self.steps['undo']:
+            return None
+        step = self.take('undo')
+        self.steps['redo'].append(step)
+        self.memory += step.size()
+        return self.apply(step.inverse())
+
+    def redo(self):
+        """Make the last undone step again; returns the position to put the cursor at, or None if there was none."""
+        if not self.steps['redo']:
+            return None
+        step = self.take('redo')
+        self.steps['undo'].append(step)
+        self.memory += step.size()
+        return self.apply(step)
+
+    def apply(self, step):
+        """Make step's edits to the document as one edit block, without recording them."""
+        hunks = list(step.hunks())
+        cursor = QTextCursor(self.document)
+        self.applying = True
+        try:
+            with tracer.span('apply undo step', 'editor', hunks=len(hunks)):
+                cursor.beginEditBlock()
+                for position, removed, inserted in reversed(hunks):
+                    cursor.setPosition(position)
+                    cursor.setPosition(position + utf16_length(removed), QTextCursor.KeepAnchor)
+                    cursor.insertText(inserted)
+                cursor.endEditBlock()
+        finally:
+            self.applying = False
+        self.document.setModified(len(self.steps['undo']) != self.clean)
+        self.trim()
+        position, removed, inserted = hunks[0]
+        return position + utf16_length(inserted)
+
+    def mark_dirty(self):
+        """Mark the document modified with no step to undo back to a clean state, as text not from its file is."""
+        self.clean = None
+        self.clean_changes = None
+        self.document.setModified(True)
+
+    def clear(self):
+        """Forget every step."""
+        self.drop('undo')
+        self.drop('redo')
+        self.clean = None
+
+    def take(self, name):
+        """Pop the step on top of a stack, reading it back from disk if it was spilled."""
+        step = self.steps[name].pop()
+        if isinstance(step, UndoStep):
+            self.memory -= step.size()
+            return step
+        self.spilled[name] -= 1
+        return pickle.loads(zlib.decompress(self.read(step)))
+
+    def drop(self, name):
+        for step in self.steps[name]:
+            if isinstance(step, UndoStep):
+                self.memory -= step.size()
+            else:
+                self.forget(step)
+        self.steps[name] = []
+        self.spilled[name] = 0
+
+    def trim(self):
+        """Spill the steps furthest from the present to disk while over the memory cap."""
+        for name, stack in self.steps.items():
+            index = self.spilled[name]
+            while self.memory > self.limit and index < len(stack):
+                self.memory -= stack[index].size()
+                stack[index] = self.write(zlib.compress(pickle.dumps(stack[index], pickle.HIGHEST_PROTOCOL), 1))
+                index += 1
+            self.spilled[name] = index
+
+    def write(self, data):
+        """Append data to the spill file; returns its (offset, length) there."""
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix='scratchpad-undo-')
+        self.spill_file.seek(0, os.SEEK_END)
+        offset = self.spill_file.tell()
+        self.spill_file.write(data)
+        self.spilled_bytes += len(data)
+        return offset, len(data)
+
+    def read(self, entry):
+        """Read back and forget data written to the spill file."""
+        self.spill_file.seek(entry[0])
+        data = self.spill_file.read(entry[1])
+        self.forget(entry)
+        return data
+
+    def forget(self, entry):
+        self.spilled_bytes -= entry[1]
+        if not self.spilled_bytes:
+            self.spill_file.truncate(0)
+
+class FileFollower(QObject):
+    """Watches a growing file, such as a log, and reports the text appended to it.
+
+    Only the bytes past the last read are read, through an incremental
+    decoder for the file's encoding, so a multibyte character split between
+    two writes comes out once it is complete. A file that shrinks was
+    truncated and one with a new inode was replaced, as log rotation does;
+    either way it is read again from the start after restarted is emitted.
+    """
+    appended = pyqtSignal(str)
+    restarted = pyqtSignal(str)
+
+    def __init__(self, file_path, encoding, offset, identity, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.encoding = encoding
+        self.offset = offset
+        self.identity = identity
+        self.paused = False
+        self.decoder = self.create_decoder()
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.schedule_read)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.read_timer = QTimer(self)
+        self.read_timer.setSingleShot(True)
+        self.read_timer.timeout.connect(self.read)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(FOLLOW_POLL_MS)
+        self.poll_timer.timeout.connect(self.schedule_read)
+        self.poll_timer.start()
+        self.watch()
+        self.schedule_read()
+
+    def create_decoder(self):
+        """Return a decoder for reading on from offset.
+
+        Past the start of the file the byte order mark is fed to it first,
+        so UTF-16 and UTF-32 decode in the file's byte order.
+        """
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(self.encoding)(errors='replace'), translate=True)
+        if self.offset:
+            try:
+                with open(self.file_path, 'rb') as file:
+                    head = file.read(4)
+            except OSError:
+                head = b''
+            for bom, encoding in BYTE_ORDER_MARKS:
+                if head.startswith(bom):
+                    if codecs.lookup(encoding).name == codecs.lookup(self.encoding).name:
+                        decoder.decode(bom)
+                    break
+        return decoder
+
+    def watch(self):
+        """Watch the file and its directory, where a rotated file's successor appears."""
+        watched = self.watcher.files() + self.watcher.directories()
+        paths = [path for path in (self.file_path, os.path.dirname(os.path.abspath(self.file_path)))
+                 if path not in watched and os.path.exists(path)]
+        if paths:
+            self.watcher.addPaths(paths)
+
+    def on_directory_changed(self, path):
+        if self.file_path not in self.watcher.files():
+            self.watch()
+        self.schedule_read()
+
+    def schedule_read(self):
+        """Read after a short pause, so a burst of writes is read at once."""
+        if not self.read_timer.isActive():
+            self.read_timer.start(FOLLOW_DEBOUNCE_MS)
+
+    def read(self):
+        """Report what was appended since the last read, at most FOLLOW_READ_BYTES at a time."""
+        if self.paused:
+            return
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self.identity or stat.st_size < self.offset:
+            reason = "replaced" if identity != self.identity else "truncated"
+            self.identity = identity
+            self.offset = 0
+            self.decoder = self.create_decoder()
+            self.watch()
+            self.restarted.emit(reason)
+        if stat.st_size <= self.offset:
+            return
+        try:
+            with open(self.file_path, 'rb') as file:
+                file.seek(self.offset)
+                data = file.read(FOLLOW_READ_BYTES)
+        except OSError as e:
+            print(f"Could not read {self.file_path}: {e}")
+            return
+        self.offset += len(data)
+        with tracer.span('decode appended', 'file', bytes=len(data)):
+            text = self.decoder.decode(data)
+        if text:
+            self.appended.emit(text)
+        if self.offset < stat.st_size:
+            self.read_timer.start(0)
+
+    def position(self):
+        """Return the offset of the first byte not yet reported as text."""
+        buffered, _ = self.decoder.getstate()
+        return self.offset - len(buffered)
+
+    def unwatch(self):
+        paths = self.watcher.files() + self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+
+    def rebase(self, file_path, encoding, offset, identity):
+        """Follow file_path on from offset; used once the file has been saved over."""
+        self.unwatch()
+        self.file_path = file_path
+        self.encoding = encoding
+        self.offset = offset
+        self.identity = identity
+        self.decoder = self.create_decoder()
+        self.watch()
+
+    def stop(self):
+        self.read_timer.stop()
+        self.poll_timer.stop()
+        self.unwatch()
+        self.deleteLater()
+
+class LineIndex:
+    """Sparse line index over a memory-mapped file.
+
+    Only the start of every LINE_INDEX_STRIDE-th line is stored; other lines
+    are found by scanning forward from the nearest checkpoint, which keeps
+    the index a few MB even for files with hundreds of millions of lines.
+    """
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.checkpoints = array('q', [0])
+        self.line_count = 1
+        self.complete = False
+
+    def build(self, should_stop, report_progress):
+        """Index the whole mapping a chunk at a time, checking should_stop and reporting progress per chunk."""
+        size = len(self.mapping)
+        pending = LINE_INDEX_STRIDE
+        for chunk_start in range(0, size, LINE_INDEX_CHUNK_BYTES):
+            if should_stop():
+                return
+            chunk = self.mapping[chunk_start:chunk_start + LINE_INDEX_CHUNK_BYTES]
+            newlines = chunk.count(b'\n')
+            if newlines >= pending:
+                # Finish the group the previous chunk started, then take whole groups,
+                # which the count guarantees are there.
+                position = 0
+                for _ in range(pending):
+                    position = chunk.find(b'\n', position) + 1
+                self.checkpoints.append(chunk_start + position)
+                newlines -= pending
+                for _ in range(newlines // LINE_INDEX_STRIDE):
+                    position = LINE_GROUP_RE.match(chunk, position).end()
+                    self.checkpoints.append(chunk_start + position)
+                newlines %= LINE_INDEX_STRIDE
+                pending = LINE_INDEX_STRIDE
+            pending -= newlines
+            report_progress(chunk_start + len(chunk))
+        self.line_count = len(self.checkpoints) * LINE_INDEX_STRIDE + 1 - pending
+        self.complete = True
+        report_progress(size)
+
+    def known_lines(self):
+        """Return how many lines can be addressed so far."""
+        if self.complete:
+            return self.line_count
+        return (len(self.checkpoints) - 1) * LINE_INDEX_STRIDE + 1
+
+    def line_start(self, line):
+        """Return the byte offset where a zero-based line starts."""
+        group, remainder = divmod(line, LINE_INDEX_STRIDE)
+        offset = self.checkpoints[min(group, len(self.checkpoints) - 1)]
+        remainder += (group - min(group, len(self.checkpoints) - 1)) * LINE_INDEX_STRIDE
+        for _ in range(remainder):
+            offset = self.mapping.find(b'\n', offset) + 1
+            if offset == 0:
+                return len(self.mapping)
+        return offset
+
+    def line_end(self, start):
+        """Return the offset of the newline ending the line that starts at start."""
+        end = self.mapping.find(b'\n', start)
+        return len(self.mapping) if end == -1 else end
+
+    def line_at(self, offset):
+        """Return the zero-based line containing a byte offset."""
+        group = bisect.bisect_right(self.checkpoints, offset) - 1
+        line = group * LINE_INDEX_STRIDE
+        position = self.checkpoints[group]
+        while (position := self.mapping.find(b'\n', position, offset) + 1) > 0:
+            line += 1
+        return line
+
+class LargeFileView(QAbstractScrollArea):
+    """Read-only view that paints only the visible lines of a memory-mapped file."""
+    position_changed = pyqtSignal()
+    max_line_bytes = 4096
+
+    def __init__(self, index, encoding, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.encoding = encoding
+        self.current_line = 0
+        self.match = None
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)
+        self.horizontalScrollBar().valueChanged.connect(self.viewport().update)
+        self.update_scroll_range()
+
+    def update_scroll_range(self):
+        """Grow the scroll range as the line index is built."""
+        self.verticalScrollBar().setRange(0, max(0, self.index.known_lines() - 1))
+        self.verticalScrollBar().setPageStep(self.visible_line_count())
+        self.viewport().update()
+
+    def visible_line_count(self):
+        """Return how many lines fit in the viewport."""
+        return max(1, self.viewport().height() // self.fontMetrics().lineSpacing())
+
+    def decode_line(self, start, end):
+        """Decode one line for display, truncated to max_line_bytes."""
+        raw = self.index.mapping[start:min(end, start + self.max_line_bytes)]
+        return raw.decode(self.encoding, errors='replace').rstrip('\r').expandtabs(4)
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        line_height = metrics.lineSpacing()
+        x = 4 - self.horizontalScrollBar().value()
+        first = self.verticalScrollBar().value()
+        start = self.index.line_start(first)
+        widest = 0
+        mapping_size = len(self.index.mapping)
+        for row in range(self.visible_line_count() + 1):
+            line = first + row
+            if line >= self.index.known_lines() or (start >= mapping_size and line > 0):
+                break
+            end = self.index.line_end(start)
+            y = row * line_height
+            if line == self.current_line:
+                painter.fillRect(0, y, self.viewport().width(), line_height,
+                                 self.palette().color(QPalette.AlternateBase))
+            if self.match and start <= self.match[0] < end + 1:
+                prefix = self.decode_line(start, self.match[0])
+                needle = self.decode_line(self.match[0], self.match[1])
+                painter.fillRect(x + metrics.horizontalAdvance(prefix), y,
+                                 metrics.horizontalAdvance(needle), line_height,
+                                 self.palette().color(QPalette.Highlight))
+            text = self.decode_line(start, end)
+            widest = max(widest, metrics.horizontalAdvance(text))
+            painter.drawText(x, y + metrics.ascent(), text)
+            start = end + 1
+        self.horizontalScrollBar().setRange(0, max(self.horizontalScrollBar().maximum(),
+                                                   widest - self.viewport().width() + 8))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.verticalScrollBar().setPageStep(self.visible_line_count())
+
+    def keyPressEvent(self, event):
+        scrollbar = self.verticalScrollBar()
+        steps = {
+            Qt.Key_Up: -1,
+            Qt.Key_Down: 1,
+            Qt.Key_PageUp: -scrollbar.pageStep(),
+            Qt.Key_PageDown: scrollbar.pageStep(),
+        }
+        if event.key() in steps:
+            self.go_to_line(self.current_line + steps[event.key()])
+        elif event.key() == Qt.Key_Home and event.modifiers() & Qt.ControlModifier:
+            self.go_to_line(0)
+        elif event.key() == Qt.Key_End and event.modifiers() & Qt.ControlModifier:
+            self.go_to_line(self.index.known_lines() - 1)
+        else:
+            super().keyPressEvent(event)
+
+    def mousePressEvent(self, event):
+        row = event.pos().y() // self.fontMetrics().lineSpacing()
+        self.go_to_line(self.verticalScrollBar().value() + row)
+
+    def go_to_line(self, line):
+        """Make a zero-based line current, scrolling it into view."""
+        self.current_line = max(0, min(line, self.index.known_lines() - 1))
+        scrollbar = self.verticalScrollBar()
+        if not scrollbar.value() <= self.current_line < scrollbar.value() + scrollbar.pageStep():
+            scrollbar.setValue(self.current_line - scrollbar.pageStep() // 2)
+        self.viewport().update()
+        self.position_changed.emit()
+
+    def find(self, text):
+        """Find text after the current match in the mapped bytes, wrapping once."""
+        needle = text.encode(self.encoding, errors='replace')
+        if not needle:
+            return False
+        start = self.match[0] + 1 if self.match else self.index.line_start(self.current_line)
+        offset = self.index.mapping.find(needle, start)
+        if offset == -1:
+            offset = self.index.mapping.find(needle, 0, start)
+        if offset == -1:
+            return False
+        self.match = (offset, offset + len(needle))
+        self.go_to_line(self.index.line_at(offset))
+        return True
 
 def load_icon(icon_name):
     """Utility function to load icons."""
@@ -128,26 +1878,103 @@ def load_icon(icon_name):
         return QIcon(icon_path)
     return None
 
+def default_style_path():
+    """Return the path of the bundled style.css."""
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, 'style.css')
+    return os.path.join(os.path.dirname(__file__), 'style.css')
+
+class StyleResources(QObject):
+    """Cached stylesheet and preview template, reloaded when their files change."""
+    changed = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self.default_css_path = default_style_path()
+        self.user_css_path = os.path.join(os.path.expanduser("~"), "spstyle.css")
+        self.user_css_exists = os.path.exists(self.user_css_path)
+        self._stylesheet = None
+        self._template = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        self.watch_files()
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.check_user_css)
+        self.poll_timer.start(USER_STYLE_POLL_MS)
+        app = QApplication.instance()
+        if app is not None:
+            app.applicationStateChanged.connect(self.on_application_state_changed)
+
+    def watch_files(self):
+        """Watch the style files, re-adding any that were replaced on disk."""
+        watched = self.watcher.files()
+        for path in (self.default_css_path, self.user_css_path):
+            if path not in watched and os.path.exists(path):
+                self.watcher.addPath(path)
+
+    def stylesheet(self):
+        """Return the application stylesheet, preferring ~/spstyle.css."""
+        if self._stylesheet is None:
+            if self.user_css_exists:
+                try:
+                    with open(self.user_css_path, 'r') as css_file:
+                        self._stylesheet = css_file.read()
+                    print(f"Loaded user CSS style from: {self.user_css_path}")
+                except Exception as e:
+                    print(f"Error loading user CSS: {e}")
+            else:
+                try:
+                    with open(self.default_css_path, 'r') as css_file:
+                        self._stylesheet = css_file.read()
+                except FileNotFoundError:
+                    print(f"Default CSS file not found: {self.default_css_path}")
+        return self._stylesheet
+
+    def template(self):
+        """Return the (prefix, suffix) of the markdown preview template."""
+        if self._template is None:
+            try:
+                from markdown_preview import parse_markdown_template
+                with open(self.default_css_path, 'r') as css_file:
+                    self._template = parse_markdown_template(css_file.read())
+            except Exception as e:
+                print(f"Error loading HTML template: {e}")
+        return self._template
+
+    def on_file_changed(self, path):
+        """Drop cached content for a changed style file."""
+        if path == self.default_css_path:
+            self._template = None
+        self.user_css_exists = os.path.exists(self.user_css_path)
+        self._stylesheet = None
+        self.watch_files()
+        self.changed.emit()
+
+    def on_application_state_changed(self, state):
+        if state == Qt.ApplicationActive:
+            self.check_user_css()
+
+    def check_user_css(self):
+        """Pick up ~/spstyle.css being created or removed."""
+        exists = os.path.exists(self.user_css_path)
+        if exists != self.user_css_exists:
+            self.user_css_exists = exists
+            self._stylesheet = None
+            self.watch_files()
+            self.changed.emit()
+
+_style_resources = None
+
+def get_style_resources():
+    """Return the shared StyleResources, creating it on first use."""
+    global _style_resources
+    if _style_resources is None:
+        _style_resources = StyleResources()
+    return _style_resources
+
 def loadStyle():
     """Load CSS styles globally for the application."""
-    user_css_path = os.path.join(os.path.expanduser("~"), "spstyle.css")
-    stylesheet = None
-    if os.path.exists(user_css_path):
-        try:
-            with open(user_css_path, 'r') as css_file:
-                stylesheet = css_file.read()
-            print(f"Loaded user CSS style from: {user_css_path}")
-        except Exception as e:
-            print(f"Error loading user CSS: {e}")
-    else:
-        css_file_path = os.path.join(os.path.dirname(__file__), 'style.css')
-        if getattr(sys, 'frozen', False):
-            css_file_path = os.path.join(sys._MEIPASS, 'style.css')
-        try:
-            with open(css_file_path, 'r') as css_file:
-                stylesheet = css_file.read()
-        except FileNotFoundError:
-            print(f"Default CSS file not found: {css_file_path}")
+    stylesheet = get_style_resources().stylesheet()
     if stylesheet:
         app = QApplication.instance()
         if app:
@@ -155,8 +1982,55 @@ def loadStyle():
         else:
             print("No QApplication instance found. Stylesheet not applied.")
 
+class SearchWorker(QThread):
+    """Thread that finds every match of a pattern in a snapshot of a document.
+
+    Match offsets are converted to QTextDocument positions, which count
+    characters outside the Basic Multilingual Plane twice. When a
+    replacement template is given, the expanded replacement of each match
+    is collected as well.
+    """
+    matches_found = pyqtSignal(int)
+
+    def __init__(self, generation, text, pattern, replacement=None):
+        super().__init__()
+        self.generation = generation
+        self.text = text
+        self.pattern = pattern
+        self.replacement = replacement
+        self.starts = array('q')
+        self.ends = array('q')
+        self.replacements = []
+        self.matched = []
+
+    def run(self):
+        with tracer.span('search', 'find', pattern=self.pattern.pattern):
+            self.find_matches()
+        self.text = None
+        self.matches_found.emit(self.generation)
+
+    def find_matches(self):
+        astral = [m.start() for m in ASTRAL_CHAR_RE.finditer(self.text)]
+        for count, match in enumerate(self.pattern.finditer(self.text)):
+            if count % 4096 == 0 and self.isInterruptionRequested():
+                return
+            start, end = match.span()
+            if astral:
+                start += bisect.bisect_left(astral, start)
+                end += bisect.bisect_left(astral, end)
+            self.starts.append(start)
+            self.ends.append(end)
+            if self.replacement is not None:
+                self.replacements.append(match.expand(self.replacement))
+                self.matched.append(match.group())
+
 class FindReplaceDialog(QDialog):
-    """Dialog for Find and Replace functionality."""
+    """Dialog for Find and Replace functionality.
+
+    Searches run on a SearchWorker over a snapshot of the document. All
+    matches are counted, those in the visible part of the editor are
+    highlighted, and Replace All is applied as a single undoable edit.
+    """
     def __init__(self, text_edit):
         super().__init__()
         self.text_edit = text_edit
@@ -171,6 +2045,16 @@ class FindReplaceDialog(QDialog):
         self.replace_input = QLineEdit(self)
         self.layout.addWidget(self.replace_label)
         self.layout.addWidget(self.replace_input)
+        self.option_layout = QHBoxLayout()
+        self.regex_checkbox = QCheckBox("Regular expression", self)
+        self.case_checkbox = QCheckBox("Match case", self)
+        self.word_checkbox = QCheckBox("Whole words", self)
+        self.option_layout.addWidget(self.regex_checkbox)
+        self.option_layout.addWidget(self.case_checkbox)
+        self.option_layout.addWidget(self.word_checkbox)
+        self.layout.addLayout(self.option_layout)
+        self.status_label = QLabel("", self)
+        self.layout.addWidget(self.status_label)
         self.button_layout = QHBoxLayout()
         self.find_button = QPushButton("Find Next", self)
         self.replace_button = QPushButton("Replace", self)
@@ -183,40 +2067,375 @@ class FindReplaceDialog(QDialog):
         self.replace_button.clicked.connect(self.replace)
         self.replace_all_button.clicked.connect(self.replace_all)
         self.setLayout(self.layout)
-        self.current_index = 0
+        self.current_index = -1
+        self.generation = 0
+        self.search_revision = None
+        self.pattern = None
+        self.starts = array('q')
+        self.ends = array('q')
+        self.workers = set()
+        self.found_generation = None
+        # The search after a Replace All leaves its "Replaced" status showing.
+        self.quiet_generation = None
+        self.pending_action = None
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.start_search)
+        self.find_input.textChanged.connect(self.search_timer.start)
+        for checkbox in (self.regex_checkbox, self.case_checkbox, self.word_checkbox):
+            checkbox.toggled.connect(self.search_timer.start)
+        self.text_edit.document().contentsChanged.connect(self.search_timer.start)
+        self.text_edit.verticalScrollBar().valueChanged.connect(self.highlight_visible)
+        self.finished.connect(self.stop)
+
+    def compile_pattern(self):
+        """Build the search regex from the inputs, or None if there is nothing valid to find."""
+        text = self.find_input.text()
+        if not text:
+            self.status_label.setText("")
+            return None
+        expression = text if self.regex_checkbox.isChecked() else re.escape(text)
+        if self.word_checkbox.isChecked():
+            expression = rf'\b(?:{expression})\b'
+        flags = re.MULTILINE if self.case_checkbox.isChecked() else re.MULTILINE | re.IGNORECASE
+        try:
+            return re.compile(expression, flags)
+        except re.error as e:
+            self.status_label.setText(f"Invalid expression: {e}")
+            return None
+
+    def replacement_template(self):
+        """Return the replacement as a template for Match.expand."""
+        replacement = self.replace_input.text()
+        if self.regex_checkbox.isChecked():
+            return replacement
+        return replacement.replace('\\', '\\\\')
+
+    def start_search(self, replacement=None):
+        """Search the current document text on a worker thread."""
+        self.search_timer.stop()
+        for worker in self.workers:
+            worker.requestInterruption()
+        self.generation += 1
+        self.pattern = self.compile_pattern()
+        self.search_revision = self.text_edit.document().revision()
+        if self.pattern is None:
+            self.starts, self.ends = array('q'), array('q')
+            self.highlight_visible()
+            return None
+        worker = SearchWorker(self.generation, self.text_edit.toPlainText(), self.pattern, replacement)
+        worker.matches_found.connect(self.on_matches_found)
+        worker.finished.connect(lambda: self.workers.discard(worker))
+        self.workers.add(worker)
+        self.status_label.setText("Searching...")
+        worker.start()
+        return worker
+
+    def on_matches_found(self, generation):
+        """Take the results of the latest search."""
+        worker = self.sender()
+        if generation != self.generation or not isinstance(worker, SearchWorker):
+            return
+        self.starts, self.ends = worker.starts, worker.ends
+        self.found_generation = generation
+        if worker.replacement is not None:
+            self.apply_replacements(worker)
+            return
+        if generation != self.quiet_generation:
+            self.status_label.setText(f"{len(self.starts)} matches")
+        self.highlight_visible()
+        action, self.pending_action = self.pending_action, None
+        if action is not None:
+            action()
+
+    def wait_for_results(self, action):
+        """Return whether the match list reflects the current document.
+
+        If it does not, a search is started if needed and action is run
+        again once its results arrive.
+        """
+        if (self.search_timer.isActive() or self.pattern is None
+                or self.search_revision != self.text_edit.document().revision()):
+            self.start_search()
+        if self.pattern is not None and self.found_generation != self.generation:
+            self.pending_action = action
+            return False
+        return True
+
+    def highlight_visible(self):
+        """Highlight the matches that fall inside the visible part of the editor."""
+        viewport = self.text_edit.viewport()
+        first = self.text_edit.cursorForPosition(QPoint(0, 0)).position()
+        last = self.text_edit.cursorForPosition(QPoint(viewport.width(), viewport.height())).position()
+        match_format = QTextCharFormat()
+        match_format.setBackground(QColor(MATCH_HIGHLIGHT_COLOR))
+        selections = []
+        document = self.text_edit.document()
+        index = bisect.bisect_left(self.ends, first)
+        while index < len(self.starts) and self.starts[index] <= last:
+            selection = QTextEdit.ExtraSelection()
+            selection.cursor = QTextCursor(document)
+            selection.cursor.setPosition(self.starts[index])
+            selection.cursor.setPosition(self.ends[index], QTextCursor.KeepAnchor)
+            selection.format = match_format
+            selections.append(selection)
+            index += 1
+        self.text_edit.setExtraSelections(selections)
+
+    def select_match(self, index):
+        """Select match number index in the editor."""
+        cursor = self.text_edit.textCursor()
+        cursor.setPosition(self.starts[index])
+        cursor.setPosition(self.ends[index], QTextCursor.KeepAnchor)
+        self.text_edit.setTextCursor(cursor)
+        self.current_index = index
+        self.status_label.setText(f"Match {index + 1} of {len(self.starts)}")
 
     def find_next(self):
         """Find the next occurrence of the text."""
-        text_to_find = self.find_input.text().strip()
-        if text_to_find:
-            options = QTextDocument.FindFlags()
-            found = self.text_edit.find(text_to_find, options)
-            if not found:
-                QMessageBox.information(self, "Not Found", "No more occurrences found.")
+        if not self.wait_for_results(self.find_next):
+            return
+        if self.pattern is None:
+            if not self.find_input.text():
+                QMessageBox.warning(self, "Empty Search", "Please enter text to find.")
+            return
+        cursor = self.text_edit.textCursor()
+        position = cursor.selectionEnd()
+        index = bisect.bisect_left(self.starts, position)
+        if index == self.current_index and index < len(self.starts) and self.starts[index] == self.ends[index] == position:
+            index += 1
+        if index < len(self.starts):
+            self.select_match(index)
         else:
-            QMessageBox.warning(self, "Empty Search", "Please enter text to find.")
+            QMessageBox.information(self, "Not Found", "No more occurrences found.")
+            cursor.movePosition(QTextCursor.Start)
+            self.text_edit.setTextCursor(cursor)
 
     def replace(self):
-        """Replace the current occurrence."""
-        text_to_find = self.find_input.text()
-        text_to_replace = self.replace_input.text()
-        if text_to_find and text_to_replace:
-            content = self.text_edit.toPlainText()
-            self.text_edit.setPlainText(content.replace(text_to_find, text_to_replace, 1))
+        """Replace the selected occurrence and move to the next one."""
+        if not self.wait_for_results(self.replace) or self.pattern is None:
+            return
+        cursor = self.text_edit.textCursor()
+        start, end = cursor.selectionStart(), cursor.selectionEnd()
+        index = bisect.bisect_left(self.starts, start)
+        if cursor.hasSelection() and index < len(self.starts) and self.starts[index] == start and self.ends[index] == end:
+            # Match against the whole text, so lookarounds and anchors see what the search saw.
+            text = self.text_edit.toPlainText()
+            match = self.pattern.match(text, utf16_index(text, start))
+            if match is not None and start + utf16_length(match.group()) == end:
+                with self.text_edit.expecting_edit():
+                    cursor.insertText(match.expand(self.replacement_template()))
+                self.text_edit.setTextCursor(cursor)
+        self.find_next()
 
     def replace_all(self):
-        """Replace all occurrences."""
-        text_to_find = self.find_input.text()
-        text_to_replace = self.replace_input.text()
-        if text_to_find and text_to_replace:
-            content = self.text_edit.toPlainText()
-            self.text_edit.setPlainText(content.replace(text_to_find, text_to_replace))
+        """Replace all occurrences as one undoable edit."""
+        if self.start_search(self.replacement_template()) is not None:
+            self.status_label.setText("Replacing...")
+
+    def apply_replacements(self, worker):
+        """Apply a Replace All result, unless the document changed since it was searched."""
+        if self.search_revision != self.text_edit.document().revision():
+            self.replace_all()
+            return
+        step = UndoStep.replacements(worker.starts, worker.matched, worker.replacements)
+        with tracer.span('replace all', 'find', matches=len(worker.starts)), self.text_edit.expecting_edit(step=step):
+            cursor = QTextCursor(self.text_edit.document())
+            cursor.beginEditBlock()
+            for index in range(len(worker.starts) - 1, -1, -1):
+                cursor.setPosition(worker.starts[index])
+                cursor.setPosition(worker.ends[index], QTextCursor.KeepAnchor)
+                cursor.insertText(worker.replacements[index])
+            cursor.endEditBlock()
+        self.start_search()
+        self.quiet_generation = self.generation
+        self.status_label.setText(f"Replaced {len(worker.replacements)} occurrences")
+
+    def stop(self):
+        """Cancel searches and remove highlights when the dialog closes."""
+        self.search_timer.stop()
+        self.pending_action = None
+        self.text_edit.document().contentsChanged.disconnect(self.search_timer.start)
+        self.text_edit.verticalScrollBar().valueChanged.disconnect(self.highlight_visible)
+        for worker in list(self.workers):
+            worker.requestInterruption()
+            worker.wait()
+        self.text_edit.setExtraSelections([])
+
+_web_session = None
+# Cancelled fetchers are left to notice the interruption on their own; keep
+# them referenced until they finish so the threads are not destroyed early.
+_cancelled_fetchers = set()
+
+def get_web_session():
+    """Return the shared requests session, so imports reuse pooled connections."""
+    global _web_session
+    if _web_session is None:
+        import requests
+        _web_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=1)
+        _web_session.mount('http://', adapter)
+        _web_session.mount('https://', adapter)
+    return _web_session
+
+def decode_web_content(body, content_type):
+    """Decode a response body using its declared charset, else UTF-8, else chardet."""
+    if 'charset=' in (content_type or '').lower():
+        import requests
+        encoding = requests.utils.get_encoding_from_headers({'content-type': content_type})
+        try:
+            return body.decode(encoding, errors='replace')
+        except LookupError:
+            pass
+    try:
+        return body.decode('utf-8')
+    except UnicodeDecodeError:
+        import chardet
+        encoding = chardet.detect(body[:ENCODING_HEAD_BYTES])['encoding'] or 'utf-8'
+        return body.decode(encoding, errors='replace')
+
+class WebCache:
+    """On-disk cache of fetched pages, revalidated with ETag and Last-Modified.
+
+    Once the bodies pass max_bytes, the least recently used pages are
+    deleted; reading a body marks it used by touching its mtime.
+    """
+    def __init__(self, directory=WEB_CACHE_DIR, max_bytes=WEB_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.body'
+
+    def lookup(self, url):
+        """Return the cached metadata for url, or None."""
+        meta_path, body_path = self.paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url or not os.path.exists(body_path):
+            return None
+        return meta
+
+    def conditional_headers(self, meta):
+        """Return request headers that let the server answer 304 Not Modified."""
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def read_body(self, url):
+        body_path = self.paths(url)[1]
+        with open(body_path, 'rb') as file:
+            body = file.read()
+        try:
+            os.utime(body_path)
+        except OSError:
+            pass
+        return body
+
+    def store(self, url, headers, body):
+        """Cache a response that carries a validator; others are not worth keeping."""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        meta = {'url': url, 'etag': etag, 'last_modified': last_modified,
+                'content_type': headers.get('Content-Type')}
+        meta_path, body_path = self.paths(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for path, data in ((body_path, body), (meta_path, json.dumps(meta).encode('utf-8'))):
+                fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.import-')
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(data)
+                os.replace(temp_path, path)
+            self.evict()
+        except OSError as e:
+            print(f"Could not cache {url}: {e}")
+
+    def evict(self):
+        """Delete least recently used pages until the bodies fit in max_bytes."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.body'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, body_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (body_path[:-len('.body')] + '.json', body_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+class WebFetcher(QThread):
+    """Thread that downloads a URL in chunks, with progress, cancel and a size limit."""
+    progress = pyqtSignal(int, int)
+    fetched = pyqtSignal(str, bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, url, cache=None, max_bytes=WEB_IMPORT_MAX_BYTES, timeout=WEB_IMPORT_TIMEOUT):
+        super().__init__()
+        self.url = url
+        self.cache = cache if cache is not None else WebCache()
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+
+    def run(self):
+        import requests
+        try:
+            self.fetch()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.failed.emit(f"Failed to fetch content: {e}")
+        except OSError as e:
+            self.failed.emit(f"Failed to read cached content: {e}")
+
+    def fetch(self):
+        meta = self.cache.lookup(self.url)
+        headers = self.cache.conditional_headers(meta)
+        with get_web_session().get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304 and meta:
+                self.fetched.emit(decode_web_content(self.cache.read_body(self.url), meta.get('content_type')), True)
+                return
+            response.raise_for_status()
+            try:
+                total = int(response.headers.get('Content-Length') or 0)
+            except ValueError:
+                total = 0
+            if total > self.max_bytes:
+                self.failed.emit(f"The page is too large to import ({total / (1024 * 1024):.1f} MB).")
+                return
+            body = bytearray()
+            for chunk in response.iter_content(WEB_IMPORT_CHUNK_BYTES):
+                if self.isInterruptionRequested():
+                    return
+                body += chunk
+                if len(body) > self.max_bytes:
+                    self.failed.emit(f"The page is larger than {self.max_bytes / (1024 * 1024):.1f} MB and was not imported.")
+                    return
+                self.progress.emit(len(body), total)
+            body = bytes(body)
+            self.cache.store(self.url, response.headers, body)
+            self.fetched.emit(decode_web_content(body, response.headers.get('Content-Type')), False)
 
 class ImportFromWebDialog(QDialog):
     """Dialog for importing content from the web using a URL."""
     def __init__(self, text_edit):
         super().__init__()
         self.text_edit = text_edit
+        self.fetcher = None
         self.setWindowTitle("Import From Web")
         self.setWindowIcon(load_icon('scratchpad.png'))
         self.layout = QVBoxLayout(self)
@@ -224,27 +2443,90 @@ class ImportFromWebDialog(QDialog):
         self.url_input = QLineEdit(self)
         self.layout.addWidget(self.url_label)
         self.layout.addWidget(self.url_input)
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.hide()
+        self.layout.addWidget(self.progress_bar)
+        self.button_layout = QHBoxLayout()
         self.fetch_button = QPushButton("Fetch", self)
-        self.layout.addWidget(self.fetch_button)
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.setEnabled(False)
+        self.button_layout.addWidget(self.fetch_button)
+        self.button_layout.addWidget(self.cancel_button)
+        self.layout.addLayout(self.button_layout)
         self.fetch_button.clicked.connect(self.fetch_from_web)
+        self.cancel_button.clicked.connect(self.cancel_fetch)
+        self.finished.connect(self.cancel_fetch)
         self.setLayout(self.layout)
 
     def fetch_from_web(self):
-        """Fetch the content from the provided URL and display it in the text editor."""
+        """Start fetching the content from the provided URL in the background."""
         url = self.url_input.text().strip()
-        if self.is_valid_url(url):
-            try:
-                response = requests.get(url)
-                response.raise_for_status()
-                self.text_edit.setPlainText(response.text)
-                self.accept()
-            except requests.exceptions.RequestException as e:
-                QMessageBox.critical(self, "Error", f"Failed to fetch content: {e}")
-        else:
+        if not self.is_valid_url(url):
             QMessageBox.warning(self, "Invalid URL", "Please enter a valid HTTPS URL.")
+            return
+        self.start_fetch(url)
+
+    def start_fetch(self, url, cache=None):
+        """Run a WebFetcher for url and show its progress."""
+        self.cancel_fetch()
+        self.fetcher = WebFetcher(url, cache)
+        self.fetcher.progress.connect(self.show_progress)
+        self.fetcher.fetched.connect(self.fetch_finished)
+        self.fetcher.failed.connect(self.fetch_failed)
+        self.fetcher.finished.connect(self.reset_controls)
+        self.fetch_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.fetcher.start()
+
+    def show_progress(self, received, total):
+        """Show download progress; an unknown total shows a busy indicator."""
+        if self.sender() is not self.fetcher:
+            return
+        if total:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(min(received, total))
+        else:
+            self.progress_bar.setFormat(f"{received // 1024} KB")
+
+    def fetch_finished(self, text, from_cache):
+        """Replace the editor's text with the fetched text, as one undoable edit, and close the dialog."""
+        if self.sender() is not self.fetcher:
+            return
+        cursor = QTextCursor(self.text_edit.document())
+        cursor.select(QTextCursor.Document)
+        with self.text_edit.expecting_edit(0, cursor.selectionEnd()):
+            cursor.insertText(text)
+        self.text_edit.moveCursor(QTextCursor.Start)
+        self.accept()
+
+    def fetch_failed(self, message):
+        if self.sender() is not self.fetcher:
+            return
+        QMessageBox.critical(self, "Error", message)
+
+    def reset_controls(self):
+        if self.sender() is not self.fetcher:
+            return
+        self.fetch_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.progress_bar.hide()
+
+    def cancel_fetch(self):
+        """Stop a running download; its results are ignored."""
+        fetcher, self.fetcher = self.fetcher, None
+        if fetcher is not None and fetcher.isRunning():
+            fetcher.requestInterruption()
+            _cancelled_fetchers.add(fetcher)
+            fetcher.finished.connect(lambda: _cancelled_fetchers.discard(fetcher))
+        self.fetch_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.progress_bar.hide()
 
     def is_valid_url(self, url):
         """Check if the provided URL is a valid HTTPS URL using validators library."""
+        import validators
         return validators.url(url) and url.startswith("https://")
 
 class UnsavedWorkDialog(QDialog):
@@ -273,39 +2555,444 @@ class UnsavedWorkDialog(QDialog):
         """Handle discard changes action."""
         self.done(2)
 
-class Scratchpad(QMainWindow):
-    def __init__(self, file_to_open=None):
-        super().__init__()
-        self.current_file = file_to_open
+class DocumentTab:
+    """State of one open document.
+
+    A clean background tab can be released down to its path, encoding,
+    cursor and scroll position; its document is read back in through the
+    loader when the tab is shown again.
+    """
+    def __init__(self, file_path=None):
+        self.current_file = file_path
+        self.encoding = "UTF-8"
+        self.document = None
+        self.loading_document = None
         self.file_handler = None
+        self.file_saver = None
+        self.saved_revision = None
+        self.large_view = None
         self.unsaved_changes = False
+        self.pending_line = None
+        self.cursor_position = 0
+        self.scroll_value = 0
+        self.last_used = 0
+        self.journal = None
+        self.recovery = None
+        self.follow = False
+        self.follower = None
+        self.loaded_bytes = 0
+        self.file_identity = None
+        self.history = None
+
+    def title(self):
+        name = os.path.basename(self.current_file) if self.current_file else "Unnamed"
+        return f"{name}*" if self.is_modified() else name
+
+    def is_modified(self):
+        return self.document is not None and self.document.isModified()
+
+    def is_blank(self):
+        """True for an untitled, empty, untouched tab that a file can be opened into."""
+        return (self.current_file is None and self.large_view is None and self.file_handler is None
+                and (self.document is None or (self.document.isEmpty() and not self.document.isModified())))
+
+    def is_busy(self):
+        return any(thread is not None and thread.isRunning() for thread in (self.file_handler, self.file_saver))
+
+    def memory_estimate(self):
+        """Rough bytes held by the tab's document and the undo steps kept in memory."""
+        if self.document is None:
+            return 0
+        return (self.document.characterCount() * TAB_BYTES_PER_CHARACTER + self.document.blockCount() * TAB_BYTES_PER_BLOCK
+                + (self.history.memory if self.history else 0))
+
+def tab_attribute(name):
+    """Expose an attribute of the current tab as an attribute of the window."""
+    return property(lambda self: getattr(self.tab, name), lambda self, value: setattr(self.tab, name, value))
+
+class Scratchpad(QMainWindow):
+    current_file = tab_attribute('current_file')
+    encoding = tab_attribute('encoding')
+    loading_document = tab_attribute('loading_document')
+    file_handler = tab_attribute('file_handler')
+    file_saver = tab_attribute('file_saver')
+    saved_revision = tab_attribute('saved_revision')
+    large_view = tab_attribute('large_view')
+    unsaved_changes = tab_attribute('unsaved_changes')
+    pending_line = tab_attribute('pending_line')
+
+    def __init__(self, file_to_open=None, line=None):
+        super().__init__()
+        self.tabs = []
+        self.tab = None
+        self.tab_clock = 0
+        self.tab_memory_budget = TAB_MEMORY_BUDGET_MB * 1024 * 1024
+        self.last_search = ""
         self.initUI()
+        self.placeholder_document = QTextDocument(self)
+        self.newTab()
+        get_style_resources().changed.connect(self.reloadStyle)
         if file_to_open:
-            self.load_file_on_startup(file_to_open)
+            self.load_file_on_startup(file_to_open, line)
 
-    def load_file_on_startup(self, file_path):
-        """Load a file automatically on startup."""
+    def load_file_on_startup(self, file_path, line=None):
+        """Open a file in a tab, optionally jumping to a line once it is loaded."""
         if os.path.exists(file_path):
-            self.current_file = file_path
-            self.file_handler = FileHandler(file_path)
-            self.file_handler.file_content_loaded.connect(self.loadFileContent)
-            self.file_handler.start()
+            self.openPath(file_path, line)
         else:
             QMessageBox.critical(self, "Error", f"File does not exist: {file_path}")
 
     def closeEvent(self, event):
-        if self.editor.document().isModified():
-            dialog = UnsavedWorkDialog(self)
-            result = dialog.exec_()
-            if result == QDialog.Accepted:
-                self.saveFile()
-                event.accept()
-            elif result == QDialog.Rejected:
-                event.ignore()
-            elif result == 2:
-                event.accept()
+        for tab in list(self.tabs):
+            if tab.is_modified():
+                self.activateTab(tab)
+                if not self.confirmClose():
+                    event.ignore()
+                    return
+        for tab in self.tabs:
+            self.stopTabThreads(tab)
+            self.stopJournal(tab)
+        event.accept()
+
+    def confirmClose(self):
+        """Ask what to do with the current tab's unsaved changes; True if it may be closed."""
+        if not self.editor.document().isModified():
+            return True
+        dialog = UnsavedWorkDialog(self)
+        result = dialog.exec_()
+        if result == QDialog.Accepted:
+            self.saveFile()
+            return self.waitForSave()
+        return result == 2
+
+    def newTab(self, file_path=None):
+        """Add a tab and switch to it."""
+        tab = DocumentTab(file_path)
+        if file_path is None:
+            tab.document = self.createDocument(tab)
+            tab.history = UndoHistory(tab.document)
+            self.startJournal(tab)
+        self.tabs.append(tab)
+        self.tab_bar.addTab(tab.title())
+        self.activateTab(tab)
+        return tab
+
+    def createDocument(self, tab):
+        """Create an empty document owned by the window for tab."""
+        document = QTextDocument(self)
+        MarkdownHighlighter(document, self.editor)
+        DocumentStats(document, document)
+        document.modificationChanged.connect(lambda modified, tab=tab: self.updateTabTitle(tab))
+        return document
+
+    def openPath(self, file_path, line=None):
+        """Open file_path in the current tab if it is blank, else in a new one."""
+        file_path = os.path.abspath(file_path)
+        for tab in self.tabs:
+            if tab.current_file and os.path.abspath(tab.current_file) == file_path:
+                self.activateTab(tab)
+                if line:
+                    if tab.is_busy():
+                        tab.pending_line = line
+                    else:
+                        self.jumpToLine(line)
+                return
+        if not self.tab.is_blank():
+            self.newTab()
+        self.startLoading(file_path)
+        self.pending_line = line
+
+    def activateTab(self, tab):
+        """Show tab in the editor, materializing its document if it was released."""
+        if tab is not self.tab and self.tab is not None:
+            self.rememberTabPosition(self.tab)
+            if self.tab.large_view:
+                self.tab.large_view.hide()
+        self.tab = tab
+        self.tab_clock += 1
+        tab.last_used = self.tab_clock
+        index = self.tabs.index(tab)
+        if self.tab_bar.currentIndex() != index:
+            self.tab_bar.blockSignals(True)
+            self.tab_bar.setCurrentIndex(index)
+            self.tab_bar.blockSignals(False)
+        if tab.large_view:
+            self.editor.hide()
+            self.preview.hide()
+            tab.large_view.show()
+            tab.large_view.setFocus()
+        else:
+            self.editor.show()
+            if tab.document is None and tab.file_handler is None and tab.current_file:
+                self.startLoading(tab.current_file)
+            self.editor.show_document(tab.document or self.placeholder_document)
+            self.editor.setReadOnly(tab.document is None)
+            tab.unsaved_changes = tab.is_modified()
+            self.restoreTabPosition(tab)
+            self.editor.setFocus()
+        self.cancel_load_button.setVisible(tab.file_handler is not None and tab.file_handler.isRunning())
+        self.actions['followfile'].setChecked(tab.follow)
+        self.updateWindowTitle()
+        self.updateStatusBar()
+        self.enforceMemoryBudget()
+
+    def rememberTabPosition(self, tab):
+        if tab.large_view:
+            tab.cursor_position = tab.large_view.current_line
+        elif tab.document is not None and self.editor.document() is tab.document:
+            tab.cursor_position = self.editor.textCursor().position()
+            tab.scroll_value = self.editor.verticalScrollBar().value()
+
+    def restoreTabPosition(self, tab):
+        if tab.document is None or self.editor.document() is not tab.document:
+            return
+        cursor = QTextCursor(tab.document)
+        cursor.setPosition(min(tab.cursor_position, tab.document.characterCount() - 1))
+        self.editor.setTextCursor(cursor)
+        self.editor.verticalScrollBar().setValue(tab.scroll_value)
+
+    def updateTabTitle(self, tab):
+        if tab in self.tabs:
+            self.tab_bar.setTabText(self.tabs.index(tab), tab.title())
+            self.tab_bar.setTabToolTip(self.tabs.index(tab), tab.current_file or "")
+
+    def updateWindowTitle(self):
+        self.updateTabTitle(self.tab)
+        if not self.current_file:
+            self.setWindowTitle('Scratchpad - Unnamed')
+        elif self.large_view:
+            self.setWindowTitle(f'Scratchpad - {os.path.basename(self.current_file)} (read-only)')
+        else:
+            self.setWindowTitle(f'Scratchpad - {os.path.basename(self.current_file)}')
+
+    def onTabChanged(self, index):
+        if 0 <= index < len(self.tabs):
+            self.activateTab(self.tabs[index])
+
+    def onTabMoved(self, source, destination):
+        self.tabs.insert(destination, self.tabs.pop(source))
+
+    def closeTab(self, index=None):
+        """Close a tab, asking first if it has unsaved changes."""
+        tab = self.tab if index is None or index is False else self.tabs[index]
+        if tab.is_modified():
+            self.activateTab(tab)
+            if not self.confirmClose():
+                return
+        self.stopTabThreads(tab)
+        tab.history = None
+        self.releaseTab(tab)
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        self.tab_bar.blockSignals(True)
+        self.tab_bar.removeTab(index)
+        self.tab_bar.blockSignals(False)
+        if tab is self.tab:
+            self.tab = None
+            if self.tabs:
+                self.activateTab(self.tabs[min(index, len(self.tabs) - 1)])
+            else:
+                self.newTab()
+
+    def switchTab(self, step):
+        """Move to the next (step 1) or previous (step -1) tab."""
+        if len(self.tabs) > 1:
+            self.activateTab(self.tabs[(self.tabs.index(self.tab) + step) % len(self.tabs)])
+
+    def stopTabThreads(self, tab):
+        if tab.file_handler and tab.file_handler.isRunning():
+            tab.file_handler.requestInterruption()
+            tab.file_handler.wait()
+        if tab.file_saver and tab.file_saver.isRunning():
+            tab.file_saver.wait()
+
+    def startJournal(self, tab):
+        """Journal the edits to tab's document from its current, saved state."""
+        self.stopJournal(tab)
+        try:
+            tab.journal = RecoveryJournal(tab.document, tab.current_file, tab.encoding, parent=self)
+        except OSError as e:
+            print(f"Could not start the recovery journal: {e}")
+
+    def stopJournal(self, tab):
+        if tab.journal:
+            tab.journal.discard()
+            tab.journal = None
+
+    def offerRecovery(self):
+        """Offer to restore unsaved work left by a Scratchpad that did not exit cleanly."""
+        journals = RecoveryJournal.abandoned()
+        if not journals:
+            return
+        names = "\n".join(journal.header['file'] or "Unnamed" for journal in journals)
+        box = QMessageBox(QMessageBox.Question, "Recover Unsaved Work",
+                          f"Scratchpad did not exit cleanly and has unsaved changes to:\n\n{names}\n\nRecover them?",
+                          parent=self)
+        recover = box.addButton("Recover", QMessageBox.AcceptRole)
+        discard = box.addButton("Discard", QMessageBox.DestructiveRole)
+        box.addButton("Later", QMessageBox.RejectRole)
+        box.exec_()
+        for journal in journals:
+            if box.clickedButton() is recover:
+                self.recoverJournal(journal)
+            elif box.clickedButton() is discard:
+                journal.discard()
+            else:
+                journal.lock.unlock()
+                journal.deleteLater()
+
+    def recoverJournal(self, journal):
+        """Open a journal's base in a tab and replay its edits once it has loaded."""
+        try:
+            base = journal.base_path()
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Could not recover unsaved changes: {e}")
+            journal.discard()
+            return
+        if not self.tab.is_blank():
+            self.newTab()
+        if base is None:
+            self.stopJournal(self.tab)
+            self.adoptJournal(self.tab, journal)
+            self.updateWindowTitle()
+        else:
+            self.startLoading(base)
+            self.tab.recovery = journal
+
+    def adoptJournal(self, tab, journal):
+        """Replay journal into tab's freshly loaded document and keep journaling there."""
+        journal.setParent(self)
+        with tab.history.expecting():
+            journal.replay(tab.document)
+        journal.follow(tab.document)
+        if journal.header['base'] == 'file':
+            tab.document.setModified(True)
         else:
-            event.accept()
+            # A snapshot or a new document never matched the file, even before the replayed edits.
+            tab.history.mark_dirty()
+        tab.journal = journal
+        tab.current_file = journal.header['file']
+        tab.encoding = journal.header['encoding']
+        tab.unsaved_changes = tab.is_modified()
+
+    def toggleFollow(self, enabled):
+        """Start or stop following the current file as it grows."""
+        tab = self.tab
+        if enabled and (tab.large_view or not tab.current_file):
+            self.actions['followfile'].setChecked(False)
+            reason = "files shown in the large-file view" if tab.large_view else "unsaved documents"
+            self.statusBar.showMessage(f"Following is not available for {reason}.", 3000)
+            return
+        tab.follow = enabled
+        if not enabled:
+            self.stopFollowing(tab)
+        elif tab.document is not None and not tab.is_busy():
+            self.startFollowing(tab)
+        self.updateStatusBar()
+
+    def startFollowing(self, tab):
+        """Append to tab's document whatever is written to its file past what was loaded."""
+        self.stopFollowing(tab)
+        tab.follower = FileFollower(tab.current_file, tab.encoding, tab.loaded_bytes, tab.file_identity, self)
+        tab.follower.appended.connect(self.appendFollowed)
+        tab.follower.restarted.connect(self.followRestarted)
+
+    def stopFollowing(self, tab):
+        if tab.follower:
+            tab.loaded_bytes, tab.file_identity = tab.follower.position(), tab.follower.identity
+            tab.follower.stop()
+            tab.follower = None
+
+    def appendFollowed(self, text):
+        """Add text appended to a followed file to the end of its document."""
+        tab = self.tabFor(self.sender())
+        if tab is None or tab.document is None:
+            return
+        with tracer.span('append followed text', 'file', length=len(text)):
+            self.editFollowedDocument(tab, lambda cursor: cursor.movePosition(QTextCursor.End), text)
+        if tab is self.tab and self.actions['followscroll'].isChecked() and not self.editor.textCursor().hasSelection():
+            self.editor.moveCursor(QTextCursor.End)
+            self.editor.ensureCursorVisible()
+
+    def followRestarted(self, reason):
+        """Start over from a followed file that was truncated or replaced.
+
+        A document without unsaved changes is emptied first, so it keeps
+        matching the file; otherwise the file's new contents are appended.
+        """
+        tab = self.tabFor(self.sender())
+        if tab is None or tab.document is None:
+            return
+        name = os.path.basename(tab.current_file)
+        if tab.document.isModified():
+            message = f"{name} was {reason}; appending its new contents."
+        else:
+            self.editFollowedDocument(tab, lambda cursor: cursor.select(QTextCursor.Document), "")
+            message = f"{name} was {reason}; showing it from the start."
+        if tab is self.tab:
+            self.statusBar.showMessage(message, 5000)
+
+    def editFollowedDocument(self, tab, select, text):
+        """Replace the text that select picks out with text from the followed file.
+
+        Changes made to a document without unsaved changes leave it clean
+        and are not undoable, so undo never takes back lines of the file.
+        """
+        document = tab.document
+        clean = not document.isModified()
+        tab.history.tracking = not clean
+        cursor = QTextCursor(document)
+        select(cursor)
+        cursor.insertText(text)
+        tab.history.tracking = True
+        if clean:
+            document.setModified(False)
+            tab.unsaved_changes = False
+            self.startJournal(tab)
+            if tab is self.tab:
+                self.updateStatusBar()
+
+    def releaseTab(self, tab):
+        """Drop a tab's document or large-file view, keeping only what is needed to reopen it."""
+        self.stopJournal(tab)
+        self.stopFollowing(tab)
+        self.rememberTabPosition(tab)
+        if tab.large_view:
+            tab.large_view.hide()
+            tab.large_view.index.mapping.close()
+            tab.large_view.deleteLater()
+            tab.large_view = None
+        if tab.document is not None:
+            if self.editor.document() is tab.document:
+                self.editor.show_document(self.placeholder_document)
+            if tab.history is not None and any(tab.history.steps.values()):
+                tab.history.release()
+            else:
+                tab.history = None
+            tab.document.deleteLater()
+            tab.document = None
+        tab.loading_document = None
+        tab.file_handler = None
+
+    def enforceMemoryBudget(self):
+        """Release clean background tabs, least recently used first, while over the memory budget."""
+        total = sum(tab.memory_estimate() for tab in self.tabs)
+        candidates = sorted((tab for tab in self.tabs
+                             if tab is not self.tab and tab.document is not None and tab.current_file
+                             and not tab.is_modified() and not tab.is_busy()),
+                            key=lambda tab: tab.last_used)
+        for tab in candidates:
+            if total <= self.tab_memory_budget:
+                break
+            total -= tab.memory_estimate()
+            self.releaseTab(tab)
+
+    def tabFor(self, worker):
+        """Return the tab that owns a loader or saver thread or a follower, or None if it is stale."""
+        for tab in self.tabs:
+            if worker is not None and worker in (tab.file_handler, tab.file_saver, tab.follower):
+                return tab
+        return None
 
     def initUI(self):
         """Initialize the UI components."""
@@ -327,21 +3014,51 @@ class Scratchpad(QMainWindow):
         # Hide preview panel by default
         self.preview.hide()
         
-        # Set splitter as central widget
-        self.setCentralWidget(self.splitter)
+        # Put a tab bar above the splitter; every tab shares the editor and preview
+        self.tab_bar = QTabBar()
+        self.tab_bar.setTabsClosable(True)
+        self.tab_bar.setMovable(True)
+        self.tab_bar.setDocumentMode(True)
+        self.tab_bar.setExpanding(False)
+        self.tab_bar.currentChanged.connect(self.onTabChanged)
+        self.tab_bar.tabCloseRequested.connect(self.closeTab)
+        self.tab_bar.tabMoved.connect(self.onTabMoved)
+        central = QWidget()
+        central_layout = QVBoxLayout(central)
+        central_layout.setContentsMargins(0, 0, 0, 0)
+        central_layout.setSpacing(0)
+        central_layout.addWidget(self.tab_bar)
+        central_layout.addWidget(self.splitter)
+        self.setCentralWidget(central)
         
         self.editor.setAcceptRichText(False)
         self.statusBar = QStatusBar(self)
         self.setStatusBar(self.statusBar)
+        self.cancel_load_button = QPushButton("Cancel", self)
+        self.cancel_load_button.clicked.connect(self.cancelLoading)
+        self.statusBar.addPermanentWidget(self.cancel_load_button)
+        self.cancel_load_button.hide()
         self.line = 1
         self.column = 1
         self.char_count = 0
-        self.encoding = "UTF-8"
+        self.selection_words = None
+        self.selection_timer = QTimer(self)
+        self.selection_timer.setSingleShot(True)
+        self.selection_timer.setInterval(SELECTION_STATS_DELAY_MS)
+        self.selection_timer.timeout.connect(self.countSelectionWords)
         self.editor.cursorPositionChanged.connect(self.updateStatusBar)
+        self.editor.selectionChanged.connect(self.onSelectionChanged)
+        self.editor.stats_changed.connect(self.updateStatusBar)
         self.createMenu()
         self.setMenuIcons()
         self.editor.textChanged.connect(self.on_text_changed)
 
+    def reloadStyle(self):
+        """Re-apply the stylesheet and preview template after a style file changed."""
+        loadStyle()
+        if self.preview.isVisible():
+            self.editor.update_preview()
+
     def on_text_changed(self):
         """Update the unsaved changes flag when text is modified."""
         self.unsaved_changes = True
@@ -363,13 +3080,73 @@ class Scratchpad(QMainWindow):
         togglePreviewAction.triggered.connect(self.togglePreview)
         menu.addAction(togglePreviewAction)
         self.actions['togglepreview'] = togglePreviewAction
+        nextTabAction = QAction('Next Tab', self)
+        nextTabAction.setShortcut('Ctrl+Tab')
+        nextTabAction.triggered.connect(lambda: self.switchTab(1))
+        menu.addAction(nextTabAction)
+        self.actions['nexttab'] = nextTabAction
+        previousTabAction = QAction('Previous Tab', self)
+        previousTabAction.setShortcut('Ctrl+Shift+Tab')
+        previousTabAction.triggered.connect(lambda: self.switchTab(-1))
+        menu.addAction(previousTabAction)
+        self.actions['previoustab'] = previousTabAction
+        menu.addSeparator()
+        followFileAction = QAction('Follow File', self)
+        followFileAction.setShortcut('Ctrl+Shift+F')
+        followFileAction.setCheckable(True)
+        followFileAction.triggered.connect(self.toggleFollow)
+        menu.addAction(followFileAction)
+        self.actions['followfile'] = followFileAction
+        followScrollAction = QAction('Scroll To New Lines While Following', self)
+        followScrollAction.setCheckable(True)
+        followScrollAction.setChecked(True)
+        menu.addAction(followScrollAction)
+        self.actions['followscroll'] = followScrollAction
+        menu.addSeparator()
+        recordTraceAction = QAction('Record Performance Trace', self)
+        recordTraceAction.setCheckable(True)
+        recordTraceAction.setChecked(tracer.enabled)
+        recordTraceAction.toggled.connect(self.toggleTracing)
+        menu.addAction(recordTraceAction)
+        self.actions['recordtrace'] = recordTraceAction
+        exportTraceAction = QAction('Export Performance Trace...', self)
+        exportTraceAction.triggered.connect(self.exportTrace)
+        menu.addAction(exportTraceAction)
+        self.actions['exporttrace'] = exportTraceAction
+
+    def toggleTracing(self, enabled):
+        """Start or stop recording timing spans."""
+        if enabled:
+            tracer.enable()
+        else:
+            tracer.disable()
+
+    def exportTrace(self):
+        """Save the recorded spans as Chrome trace JSON (open in chrome://tracing or Perfetto)."""
+        if not tracer.events:
+            QMessageBox.information(self, "Performance Trace",
+                                    "No spans have been recorded. Turn on View > Record Performance Trace, "
+                                    "or start Scratchpad with --trace, then reproduce the slowdown.")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Performance Trace", "scratchpad-trace.json",
+                                                   "Trace Files (*.json);;All Files (*)")
+        if not file_path:
+            return
+        try:
+            count = tracer.export(file_path)
+            self.statusBar.showMessage(f"Exported {count} spans to {os.path.basename(file_path)}", 3000)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Failed to export trace: {e}")
 
     def togglePreview(self):
         """Toggle the visibility of the preview panel."""
-        if self.preview.isVisible():
+        if self.large_view:
+            self.statusBar.showMessage("Markdown preview is not available for large files.")
+        elif self.preview.isVisible():
             self.preview.hide()
         else:
             self.preview.show()
+            self.editor.update_preview()
 
     def createFileActions(self, menu):
         """Create file actions and add them to the given menu."""
@@ -394,6 +3171,11 @@ class Scratchpad(QMainWindow):
         saveAsAction.triggered.connect(self.saveFileAs)
         menu.addAction(saveAsAction)
         self.actions['saveas'] = saveAsAction
+        closeTabAction = QAction('Close Tab', self)
+        closeTabAction.setShortcut('Ctrl+W')
+        closeTabAction.triggered.connect(lambda: self.closeTab())
+        menu.addAction(closeTabAction)
+        self.actions['closetab'] = closeTabAction
         importFromWebAction = QAction('Import From Web', self)
         importFromWebAction.triggered.connect(self.importFromWeb)
         menu.addAction(importFromWebAction)
@@ -444,6 +3226,11 @@ class Scratchpad(QMainWindow):
         findReplaceAction.setShortcut('Ctrl+F')
         menu.addAction(findReplaceAction)
         self.actions['findreplace'] = findReplaceAction
+        goToLineAction = QAction('Go to Line...', self)
+        goToLineAction.setShortcut('Ctrl+G')
+        goToLineAction.triggered.connect(self.goToLine)
+        menu.addAction(goToLineAction)
+        self.actions['gotoline'] = goToLineAction
 
     def setMenuIcons(self):
         """Set icons for menu actions if available in the icons folder."""
@@ -474,19 +3261,51 @@ class Scratchpad(QMainWindow):
 
     def openFindReplaceDialog(self):
         """Open the find and replace dialog."""
+        if self.large_view:
+            text, ok = QInputDialog.getText(self, "Find", "Find:", text=self.last_search)
+            if ok and text:
+                self.last_search = text
+                if not self.large_view.find(text):
+                    QMessageBox.information(self, "Not Found", "No occurrences found.")
+            return
         dialog = FindReplaceDialog(self.editor)
         dialog.exec_()
 
+    def goToLine(self):
+        """Jump to a line number in the editor or large-file view."""
+        if self.large_view:
+            line_count = self.large_view.index.known_lines()
+            current = self.large_view.current_line + 1
+        else:
+            line_count = self.editor.document().blockCount()
+            current = self.editor.textCursor().blockNumber() + 1
+        line, ok = QInputDialog.getInt(self, "Go to Line", f"Line (1 - {line_count}):", current, 1, line_count)
+        if ok:
+            self.jumpToLine(line)
+
+    def jumpToLine(self, line):
+        """Move the cursor to a 1-based line number, clamped to the document."""
+        if self.large_view:
+            self.large_view.go_to_line(max(0, min(line, self.large_view.index.known_lines()) - 1))
+        else:
+            block = self.editor.document().findBlockByNumber(max(0, min(line, self.editor.document().blockCount()) - 1))
+            self.editor.setTextCursor(QTextCursor(block))
+            self.editor.ensureCursorVisible()
+
+    def jumpToPendingLine(self):
+        """Go to the line requested on the command line once the file has loaded."""
+        if self.pending_line:
+            self.jumpToLine(self.pending_line)
+        self.pending_line = None
+
     def importFromWeb(self):
         """Open the dialog to import content from the web."""
         dialog = ImportFromWebDialog(self.editor)
         dialog.exec_()
 
     def newFile(self):
-        """Create a new file."""
-        self.current_file = None
-        self.editor.clear()
-        self.setWindowTitle('Scratchpad - Unnamed')
+        """Create a new file in its own tab."""
+        self.newTab()
 
     def openFile(self):
         """Open a file for editing."""
@@ -495,64 +3314,251 @@ class Scratchpad(QMainWindow):
             file_name, _ = QFileDialog.getOpenFileName(self, "Open File", "", 
                 "Markdown Files (*.md);;Text Files (*.txt);;All Files (*)", options=options)
             if file_name:
-                self.current_file = file_name
-                self.file_handler = FileHandler(file_name)
-                self.file_handler.file_content_loaded.connect(self.loadFileContent)
-                self.file_handler.start()
+                self.openPath(file_name)
         except Exception as e:
             QMessageBox.warning(self, "Error", f"Failed to open file: {e}")
 
+    def startLoading(self, file_path):
+        """Start streaming a file into the editor on a FileHandler thread.
+
+        Files above LARGE_FILE_THRESHOLD are memory-mapped and shown in a
+        read-only LargeFileView instead of being decoded into the editor.
+        """
+        self.cancelLoading()
+        self.leaveLargeFileMode()
+        self.stopFollowing(self.tab)
+        self.current_file = file_path
+        self.loading_document = None
+        self.updateWindowTitle()
+        try:
+            large_file = os.path.getsize(file_path) >= LARGE_FILE_THRESHOLD
+        except OSError:
+            # A file deleted or renamed since its tab was released fails in the
+            # loader, which reports it and leaves the tab an empty document.
+            large_file = False
+        self.file_handler = FileHandler(file_path, large_file=large_file)
+        self.file_handler.large_file_opened.connect(self.openLargeFile)
+        self.file_handler.file_content_loaded.connect(self.loadFileContent)
+        self.file_handler.load_progress.connect(self.showLoadProgress)
+        self.file_handler.load_finished.connect(self.finishLoading)
+        self.file_handler.load_failed.connect(self.loadingFailed)
+        self.cancel_load_button.show()
+        self.file_handler.start()
+
+    def cancelLoading(self):
+        """Stop the file load in progress, keeping what was read so far."""
+        if self.file_handler and self.file_handler.isRunning():
+            self.file_handler.requestInterruption()
+            self.file_handler.wait()
+
+    def openLargeFile(self, index, encoding):
+        """Replace the editor with a virtualized view of a memory-mapped file."""
+        tab = self.tabFor(self.sender())
+        if tab is None:
+            return
+        tab.encoding = encoding
+        tab.large_view = LargeFileView(index, encoding)
+        tab.large_view.position_changed.connect(self.updateStatusBar)
+        self.splitter.insertWidget(0, tab.large_view)
+        if tab is self.tab:
+            self.activateTab(tab)
+        else:
+            tab.large_view.hide()
+
+    def leaveLargeFileMode(self):
+        """Drop the large-file view and bring the editor back."""
+        if self.large_view is None:
+            return
+        self.large_view.hide()
+        self.large_view.index.mapping.close()
+        self.large_view.deleteLater()
+        self.large_view = None
+        self.editor.show()
+
     def loadFileContent(self, content, encoding):
-        """Load the content into the text edit."""
-        if encoding:
-            self.encoding = encoding
-        if content.startswith("Error reading file"):
-            QMessageBox.critical(self, "Error", content)
+        """Append a freshly read chunk to the document being loaded."""
+        tab = self.tabFor(self.sender())
+        if tab is None:
+            return
+        if tab.loading_document is None:
+            tab.loading_document = self.createDocument(tab)
+            tab.loading_document.setUndoRedoEnabled(False)
+        with tracer.span('insert chunk', 'file', length=len(content)):
+            cursor = QTextCursor(tab.loading_document)
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(content)
+        tab.file_handler.chunk_consumed()
+
+    def showLoadProgress(self, bytes_read, percent):
+        """Show how much of the file has been read."""
+        tab = self.tabFor(self.sender())
+        if tab is not self.tab:
+            return
+        if self.large_view:
+            self.large_view.update_scroll_range()
+            self.statusBar.showMessage(f"Indexing {os.path.basename(self.current_file)}: {percent}% "
+                                       f"({self.large_view.index.known_lines()} lines)")
         else:
-            self.editor.setPlainText(content)
-            self.setWindowTitle(f'Scratchpad - {os.path.basename(self.current_file)}')
+            self.statusBar.showMessage(f"Loading {os.path.basename(self.current_file)}: "
+                                       f"{percent}% ({bytes_read / (1024 * 1024):.1f} MB)")
+
+    def finishLoading(self, encoding, cancelled):
+        """Show the document once the file has been streamed in."""
+        tab = self.tabFor(self.sender())
+        if tab is None:
+            return
+        tab.encoding = encoding
+        if tab is self.tab:
+            self.cancel_load_button.hide()
+        if tab.large_view:
+            if tab is self.tab:
+                self.large_view.update_scroll_range()
+                self.jumpToPendingLine()
+                self.updateStatusBar()
+                if cancelled:
+                    self.statusBar.showMessage("Indexing cancelled; only the lines indexed so far can be shown.")
+            return
+        document = tab.loading_document or self.createDocument(tab)
+        tab.loading_document = None
+        document.setModified(False)
+        if tab.history is not None and tab.history.released is not None and not cancelled:
+            tab.history.reattach(document)
+        else:
+            tab.history = UndoHistory(document)
+        previous, tab.document = tab.document, document
+        tab.unsaved_changes = False
+        tab.loaded_bytes = tab.file_handler.bytes_read
+        tab.file_identity = tab.file_handler.file_identity
+        recovery, tab.recovery = tab.recovery, None
+        if cancelled:
+            self.stopJournal(tab)
+            if recovery:
+                recovery.lock.unlock()
+                recovery.deleteLater()
+        elif recovery:
+            self.stopJournal(tab)
+            self.adoptJournal(tab, recovery)
+        else:
+            self.startJournal(tab)
+        if tab.follow and not cancelled:
+            self.startFollowing(tab)
+        else:
+            tab.follow = False
+        if tab is self.tab:
+            self.actions['followfile'].setChecked(tab.follow)
+            with tracer.span('swap in document', 'file'):
+                self.editor.show_document(document)
+            self.editor.setReadOnly(False)
+            self.restoreTabPosition(tab)
+            self.jumpToPendingLine()
+            self.updateWindowTitle()
+            self.updateStatusBar()
+            if cancelled:
+                self.statusBar.showMessage("Loading cancelled; showing the part of the file read so far.")
+        else:
+            self.updateTabTitle(tab)
+        if previous is not None:
+            previous.deleteLater()
+        self.enforceMemoryBudget()
+
+    def loadingFailed(self, message):
+        """Report a file that could not be read."""
+        tab = self.tabFor(self.sender())
+        if tab is None:
+            return
+        tab.loading_document = None
+        if tab.recovery:
+            tab.recovery.lock.unlock()
+            tab.recovery.deleteLater()
+            tab.recovery = None
+        if tab.document is None:
+            tab.document = self.createDocument(tab)
+            tab.history = UndoHistory(tab.document)
+        if tab is self.tab:
+            self.cancel_load_button.hide()
+            self.editor.show_document(tab.document)
+            self.editor.setReadOnly(False)
+        QMessageBox.critical(self, "Error", message)
 
     def saveFile(self):
         """Save the current file."""
-        content = self.editor.toPlainText()
+        if self.large_view:
+            QMessageBox.information(self, "Read-only", "Large files are opened read-only and cannot be saved.")
+            return
         if self.encoding is None:
             self.encoding = 'utf-8'
-        try:
-            content.encode(self.encoding)
-            if self.current_file:
-                self.saveFileWithEncoding(content, self.encoding)
-                self.unsaved_changes = False
-                self.updateStatusBar(after_save=True)
-            else:
-                self.saveFileAs()
-        except UnicodeEncodeError:
-            self.promptForEncoding(content)
+        if self.current_file:
+            self.saveFileWithEncoding(self.encoding)
+        else:
+            self.saveFileAs()
 
-    def promptForEncoding(self, content):
+    def promptForEncoding(self, failed_encoding=None):
         """Prompt the user for encoding if characters can't be saved in UTF-8."""
-        encoding, ok = QInputDialog.getItem(self, "Choose Encoding", "Select Encoding", 
+        label = "Select Encoding"
+        if failed_encoding:
+            label = f"Some characters cannot be saved as {failed_encoding}. Select Encoding"
+        encoding, ok = QInputDialog.getItem(self, "Choose Encoding", label, 
                                              ["UTF-8", "ISO-8859-1", "Windows-1252", "UTF-16"], 0, False)
         if ok:
-            self.saveFileWithEncoding(content, encoding)
+            self.saveFileWithEncoding(encoding)
     
-    def saveFileWithEncoding(self, content, encoding):
-        """Save the file with the chosen encoding."""
-        if self.current_file:
-            try:
-                with open(self.current_file, 'w', encoding=encoding) as file:
-                    file.write(content)
-                self.unsaved_changes = False
-                self.updateStatusBar(after_save=True)
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"Failed to save file with encoding '{encoding}': {e}")
+    def saveFileWithEncoding(self, encoding):
+        """Save a snapshot of the document with the chosen encoding on a FileSaver thread."""
+        if not self.current_file:
+            return
+        if self.file_saver and self.file_saver.isRunning():
+            self.file_saver.wait()
+        document = self.editor.document()
+        self.saved_revision = document.revision()
+        with tracer.span('save snapshot', 'save'):
+            content = self.editor.toPlainText()
+        self.file_saver = FileSaver(self.current_file, content, encoding)
+        self.file_saver.file_saved.connect(self.handleSaveFile)
+        self.file_saver.encoding_failed.connect(self.promptForEncoding)
+        self.file_saver.finished.connect(self.saveFinished)
+        if self.tab.follower:
+            # Saving replaces the file, which would look like a rotation.
+            self.tab.follower.paused = True
+        self.statusBar.showMessage(f"Saving {os.path.basename(self.current_file)}...")
+        self.file_saver.start()
+
+    def waitForSave(self):
+        """Wait for a background save to finish; True if the document ended up saved."""
+        if self.file_saver:
+            self.file_saver.wait()
+            QApplication.processEvents()
+        return not self.editor.document().isModified()
 
-    def handleSaveFile(self, success):
+    def handleSaveFile(self, success, error, elapsed):
         """Handle the result of the save operation."""
+        tab = self.tabFor(self.sender())
+        if tab is None or self.sender() is not tab.file_saver:
+            return
         if success:
-            self.unsaved_changes = False
-            self.updateStatusBar()
+            tab.encoding = tab.file_saver.encoding
+            try:
+                stat = os.stat(tab.current_file)
+                tab.loaded_bytes, tab.file_identity = stat.st_size, (stat.st_dev, stat.st_ino)
+            except OSError:
+                pass
+            if tab.follower:
+                tab.follower.rebase(tab.current_file, tab.encoding, tab.loaded_bytes, tab.file_identity)
+            if tab.document is not None and tab.document.revision() == tab.saved_revision:
+                tab.document.setModified(False)
+                tab.unsaved_changes = False
+                self.startJournal(tab)
+            if tab is self.tab:
+                self.updateStatusBar(after_save=not self.unsaved_changes)
+                self.statusBar.showMessage(f"Saved {os.path.basename(self.current_file)} in {elapsed * 1000:.0f} ms", 3000)
         else:
-            QMessageBox.warning(self, "Error", "Failed to save file!")
+            QMessageBox.warning(self, "Error", f"Failed to save file with encoding '{tab.file_saver.encoding}': {error}")
+
+    def saveFinished(self):
+        """Let a followed file be read again once a save is over, whatever its outcome."""
+        tab = self.tabFor(self.sender())
+        if tab is not None and tab.follower:
+            tab.follower.paused = False
+            tab.follower.schedule_read()
 
     def saveFileAs(self):
         """Save the current file as a new file."""
@@ -562,29 +3568,244 @@ class Scratchpad(QMainWindow):
                 "Markdown Files (*.md);;Text Files (*.txt);;All Files (*)", options=options)
             if file_name:
                 self.current_file = file_name
+                self.updateWindowTitle()
                 self.saveFile()
         except Exception as e:
             QMessageBox.warning(self, "Error", f"Failed to save file: {e}")
 
+    def onSelectionChanged(self):
+        """Defer counting words in the selection until it settles."""
+        self.selection_words = None
+        if self.editor.textCursor().hasSelection():
+            self.selection_timer.start()
+        else:
+            self.selection_timer.stop()
+        self.updateStatusBar()
+
+    def countSelectionWords(self):
+        """Count the words in the current selection."""
+        cursor = self.editor.textCursor()
+        self.selection_words = len(cursor.selectedText().split()) if cursor.hasSelection() else None
+        self.updateStatusBar()
+
     def updateStatusBar(self, after_save=False):
         """Update the status bar with line and column information."""
-        cursor = self.editor.textCursor()
-        self.line = cursor.blockNumber() + 1
-        self.column = cursor.columnNumber() + 1
-        self.char_count = len(self.editor.toPlainText())
+        with tracer.span('status bar', 'editor'):
+            if self.large_view:
+                index = self.large_view.index
+                lines = f"{index.known_lines()}" if index.complete else f"{index.known_lines()}+"
+                self.statusBar.showMessage(f"Line: {self.large_view.current_line + 1} of {lines} | "
+                                           f"Size: {len(index.mapping) / (1024 * 1024):.1f} MB | "
+                                           f"Encoding: {self.encoding} | Read-only")
+                return
+            cursor = self.editor.textCursor()
+            self.line = cursor.blockNumber() + 1
+            self.column = cursor.columnNumber() + 1
+            stats = self.editor.stats
+            self.char_count = stats.characters
+
+            selection = ""
+            if cursor.hasSelection():
+                selection = f" | Selected: {cursor.selectionEnd() - cursor.selectionStart()}"
+                if self.selection_words is not None:
+                    selection += f" ({self.selection_words} words)"
+
+            asterisk = ""
+            if not after_save:
+                asterisk = "*" if self.unsaved_changes else ""
+            following = " | Following" if self.tab.follow else ""
+
+            self.statusBar.showMessage(f"Line: {self.line} | Column: {self.column} | Characters: {self.char_count} | "
+                                       f"Words: {stats.words} | Lines: {stats.lines}{selection} | Encoding: {self.encoding}{following} {asterisk}")
+
+class StartupTimer(QObject):
+    """Record how long startup takes, up to the first paint of the editor.
+
+    The report splits the time into module imports, window construction
+    and first paint. With a budget, the application exits after the first
+    paint, with status 1 if startup took longer than the budget.
+    """
+    def __init__(self, window, budget_ms=None):
+        super().__init__()
+        self.budget_ms = budget_ms
+        self.marks = [('start', STARTUP_STARTED)]
+        self.painted = False
+        window.editor.viewport().installEventFilter(self)
+
+    def mark(self, name, at=None):
+        self.marks.append((name, at if at is not None else time.perf_counter()))
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and not self.painted:
+            self.painted = True
+            self.mark('first paint')
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self):
+        """Print the startup timings and enforce the budget, if any."""
+        stages = [f"{name} {(at - self.marks[i][1]) * 1000:.1f} ms" for i, (name, at) in enumerate(self.marks[1:])]
+        total_ms = (self.marks[-1][1] - self.marks[0][1]) * 1000
+        print(f"Startup: {', '.join(stages)}, total {total_ms:.1f} ms", file=sys.stderr)
+        if self.budget_ms is not None:
+            if total_ms > self.budget_ms:
+                print(f"Startup took {total_ms:.1f} ms, over the budget of {self.budget_ms:.0f} ms", file=sys.stderr)
+            QApplication.exit(1 if total_ms > self.budget_ms else 0)
 
-        asterisk = ""
-        if not after_save:
-            asterisk = "*" if self.unsaved_changes else ""
+def instance_server_name():
+    """Name of the local socket shared by one user's Scratchpad instances."""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = 'user'
+    return f'scratchpad-{hashlib.sha1(user.encode("utf-8")).hexdigest()[:12]}'
+
+def send_to_running_instance(file_path, line=None):
+    """Ask an already running Scratchpad to open file_path; True if it accepted."""
+    socket = QLocalSocket()
+    socket.connectToServer(instance_server_name())
+    if not socket.waitForConnected(INSTANCE_CONNECT_TIMEOUT_MS):
+        return False
+    request = {'path': os.path.abspath(file_path), 'line': line}
+    socket.write(json.dumps(request).encode('utf-8') + b'\n')
+    socket.waitForBytesWritten(INSTANCE_REPLY_TIMEOUT_MS)
+    deadline = time.perf_counter() + INSTANCE_REPLY_TIMEOUT_MS / 1000
+    reply = b''
+    while not reply.endswith(b'\n') and time.perf_counter() < deadline:
+        if socket.waitForReadyRead(INSTANCE_REPLY_TIMEOUT_MS):
+            reply += bytes(socket.readAll())
+        elif socket.state() != QLocalSocket.ConnectedState:
+            break
+    socket.disconnectFromServer()
+    return reply.strip() == b'ok'
+
+class InstanceServer(QObject):
+    """Local socket server that receives open requests from later launches.
+
+    Each client sends one JSON line, {"path": ..., "line": ...}, and gets
+    "ok" back once the request has been accepted.
+    """
+    open_requested = pyqtSignal(str, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self.on_new_connection)
+        name = instance_server_name()
+        # Listening replaces any socket already there, so make sure it is not
+        # a live instance's before taking it over.
+        probe = QLocalSocket()
+        probe.connectToServer(name)
+        if probe.waitForConnected(INSTANCE_CONNECT_TIMEOUT_MS):
+            probe.abort()
+            print("Single-instance server unavailable: another instance is listening")
+            return
+        if not self.server.listen(name):
+            # A previous instance that crashed can leave its socket behind.
+            QLocalServer.removeServer(name)
+            if not self.server.listen(name):
+                print(f"Single-instance server unavailable: {self.server.errorString()}")
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            connection.buffer = b''
+            connection.readyRead.connect(lambda connection=connection: self.read_request(connection))
+            connection.disconnected.connect(connection.deleteLater)
+
+    def read_request(self, connection):
+        connection.buffer += bytes(connection.readAll())
+        if b'\n' not in connection.buffer:
+            return
+        data = connection.buffer
+        try:
+            request = json.loads(data.split(b'\n', 1)[0])
+            path = request['path']
+            line = request.get('line')
+            if not isinstance(path, str) or not (line is None or isinstance(line, int)):
+                raise ValueError("malformed request")
+        except (ValueError, KeyError, TypeError):
+            connection.write(b'error\n')
+            connection.disconnectFromServer()
+            return
+        connection.write(b'ok\n')
+        connection.flush()
+        self.open_requested.emit(path, line)
+
+def open_requested_file(window, file_path, line=None):
+    """Open a file forwarded by another launch in a tab of window."""
+    window.show()
+    window.load_file_on_startup(file_path, line)
+    window.setWindowState(window.windowState() & ~Qt.WindowMinimized)
+    window.raise_()
+    window.activateWindow()
+
+def parse_arguments(argv):
+    """Parse Scratchpad's command line; options Qt understands are passed through."""
+    parser = argparse.ArgumentParser(prog='scratchpad')
+    parser.add_argument('file', nargs='?', help="file to open; +N before it opens at line N")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print how long startup took (also enabled by SCRATCHPAD_STARTUP_REPORT=1)")
+    parser.add_argument('--check-startup', nargs='?', type=float, const=STARTUP_BUDGET_MS, metavar='MS',
+                        help=f"exit after the first paint, failing if startup took longer than MS (default {STARTUP_BUDGET_MS})")
+    parser.add_argument('--new-instance', action='store_true',
+                        help="start a separate Scratchpad instead of handing the file to a running one")
+    parser.add_argument('--trace', action='store_true',
+                        help="record timing spans from startup (also enabled by SCRATCHPAD_TRACE=1)")
+    parser.add_argument('--render', nargs='+', metavar='SRC',
+                        help="render markdown files or directories to HTML without opening a window")
+    parser.add_argument('--out', metavar='DIR', help="output directory for --render")
+    parser.add_argument('--jobs', type=int, metavar='N', help="worker processes for --render (default: one per CPU)")
+    parser.add_argument('--legacy-markdown', action='store_true',
+                        help="render ~~, 'quotes' and blockquotes the way older versions did "
+                             "(also enabled by SCRATCHPAD_LEGACY_MARKDOWN=1)")
+    line = None
+    remaining = []
+    for argument in argv:
+        match = LINE_ARGUMENT_RE.match(argument)
+        if match and line is None:
+            line = int(match.group(1))
+        else:
+            remaining.append(argument)
+    args, _ = parser.parse_known_args(remaining)
+    args.line = line
+    if args.render and not args.out:
+        parser.error("--render requires --out DIR")
+    return args
 
-        self.statusBar.showMessage(f"Line: {self.line} | Column: {self.column} | Characters: {self.char_count} | Encoding: {self.encoding} {asterisk}")
+def render_files(sources, out_dir, jobs=None):
+    """Render markdown files with the preview template; return an exit status."""
+    from markdown_preview import parse_markdown_template, render_batch
+    with open(default_style_path(), 'r') as css_file:
+        template = parse_markdown_template(css_file.read())
+    return 1 if render_batch(sources, out_dir, template, jobs) else 0
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    imported = time.perf_counter()
+    args = parse_arguments(sys.argv[1:])
+    if args.trace:
+        tracer.enable()
+    if args.legacy_markdown:
+        os.environ['SCRATCHPAD_LEGACY_MARKDOWN'] = '1'
+    if args.render:
+        sys.exit(render_files(args.render, args.out, args.jobs))
+    single_instance = not args.new_instance and args.check_startup is None
+    if single_instance and args.file and send_to_running_instance(args.file, args.line):
+        sys.exit(0)
     app = QApplication(sys.argv)
     loadStyle()
-    file_to_open = None
-    if len(sys.argv) > 1:
-        file_to_open = sys.argv[1]
-    scratchpad = Scratchpad(file_to_open)
+    scratchpad = Scratchpad(args.file, args.line)
+    if single_instance:
+        instance_server = InstanceServer(app)
+        instance_server.open_requested.connect(lambda path, line: open_requested_file(scratchpad, path, line))
+    startup_timer = None
+    if args.startup_report or args.check_startup is not None or os.environ.get('SCRATCHPAD_STARTUP_REPORT'):
+        startup_timer = StartupTimer(scratchpad, args.check_startup)
+        startup_timer.mark('imports', imported)
+        startup_timer.mark('window')
     scratchpad.show()
+    if args.check_startup is None:
+        QTimer.singleShot(0, scratchpad.offerRecovery)
     sys.exit(app.exec_())
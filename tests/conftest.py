@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ.setdefault('SCRATCHPAD_RECOVERY_DIR', tempfile.mkdtemp(prefix='scratchpad-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+@pytest.fixture
+def wait(qapp):
+    """Return a function that processes events until predicate() is true."""
+    import time
+
+    def wait(predicate, timeout=10):
+        deadline = time.perf_counter() + timeout
+        while not predicate():
+            assert time.perf_counter() < deadline, "timed out"
+            qapp.processEvents()
+        return True
+    return wait
+
+@pytest.fixture
+def window(qapp):
+    """A Scratchpad window, closed without prompting when the test ends."""
+    from scratchpad import Scratchpad
+    window = Scratchpad()
+    yield window
+    for tab in window.tabs:
+        if tab.document is not None:
+            tab.document.setModified(False)
+        tab.unsaved_changes = False
+    window.close()
+    # Normally stopped when the application quits, which tests never do.
+    window.editor.renderer.stop()
+    window.deleteLater()
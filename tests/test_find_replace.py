@@ -0,0 +1,85 @@
+import re
+
+import pytest
+from PyQt5.QtGui import QTextCursor
+
+import scratchpad
+from scratchpad import FindReplaceDialog, SearchWorker
+
+def matches(text, pattern, replacement=None):
+    worker = SearchWorker(1, text, pattern, replacement)
+    worker.run()
+    return list(zip(worker.starts, worker.ends)), worker.replacements
+
+@pytest.fixture
+def dialog(qapp, window, monkeypatch):
+    monkeypatch.setattr(scratchpad.QMessageBox, 'information', lambda *args: None)
+    dialog = FindReplaceDialog(window.editor)
+    yield dialog
+    dialog.close()
+    dialog.stop()
+
+def search(dialog, wait, find, replace='', regex=False, case=False, words=False):
+    dialog.regex_checkbox.setChecked(regex)
+    dialog.case_checkbox.setChecked(case)
+    dialog.word_checkbox.setChecked(words)
+    dialog.replace_input.setText(replace)
+    dialog.find_input.setText(find)
+    dialog.start_search()
+    wait(lambda: dialog.pattern is None or dialog.found_generation == dialog.generation)
+
+def test_worker_reports_document_positions_and_expansions(qapp):
+    # 😀 counts as two QTextDocument positions.
+    found, replacements = matches('a😀 cat, Cat\ncat', re.compile(r'(c)at', re.MULTILINE), r'\1og')
+    assert found == [(4, 7), (13, 16)]
+    assert replacements == ['cog', 'cog']
+
+def test_dialog_options_build_the_pattern(qapp, window, dialog, wait):
+    QTextCursor(window.editor.document()).insertText('cat Cat concat c.t\n')
+    search(dialog, wait, 'cat')
+    assert len(dialog.starts) == 3
+    search(dialog, wait, 'cat', case=True)
+    assert len(dialog.starts) == 2
+    search(dialog, wait, 'cat', words=True)
+    assert list(dialog.starts) == [0, 4]
+    search(dialog, wait, 'c.t')
+    assert list(dialog.starts) == [15]
+    search(dialog, wait, r'c.t$', regex=True)
+    assert list(dialog.starts) == [15]
+    search(dialog, wait, '(unclosed', regex=True)
+    assert dialog.pattern is None and dialog.status_label.text().startswith("Invalid expression")
+
+def test_replace_all_is_one_undo_step(qapp, window, dialog, wait):
+    editor = window.editor
+    QTextCursor(editor.document()).insertText('price $5, cost $7\nfoo\n')
+    before = editor.toPlainText()
+    steps = len(window.tab.history.steps['undo'])
+    search(dialog, wait, r'(?<=\$)(\d)', replace=r'<\1>', regex=True)
+    dialog.replace_all()
+    wait(lambda: dialog.status_label.text().startswith("Replaced"))
+    assert editor.toPlainText() == 'price $<5>, cost $<7>\nfoo\n'
+    assert len(window.tab.history.steps['undo']) == steps + 1
+    wait(lambda: dialog.pattern is None or dialog.found_generation == dialog.generation)
+    assert dialog.status_label.text() == "Replaced 2 occurrences"
+    editor.undo()
+    assert editor.toPlainText() == before
+    editor.redo()
+    assert editor.toPlainText() == 'price $<5>, cost $<7>\nfoo\n'
+
+def test_replace_expands_against_the_whole_text(qapp, window, dialog, wait):
+    editor = window.editor
+    QTextCursor(editor.document()).insertText('x😀 $5\nfoo\n')
+    search(dialog, wait, r'(?<=\$)(\d)', replace=r'[\1]', regex=True)
+    cursor = editor.textCursor()
+    cursor.setPosition(0)
+    editor.setTextCursor(cursor)
+    dialog.find_next()
+    assert editor.textCursor().selectedText() == '5'
+    dialog.replace()
+    wait(lambda: dialog.found_generation == dialog.generation and dialog.pending_action is None)
+    assert editor.toPlainText() == 'x😀 $[5]\nfoo\n'
+    search(dialog, wait, '^foo$', replace='bar', regex=True)
+    dialog.find_next()
+    dialog.replace()
+    wait(lambda: 'bar' in editor.toPlainText())
+    assert editor.toPlainText() == 'x😀 $[5]\nbar\n'
@@ -0,0 +1,47 @@
+import mmap
+import random
+
+import scratchpad
+from scratchpad import LINE_INDEX_STRIDE, LineIndex
+
+def build_index(path):
+    with open(path, 'rb') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    index = LineIndex(mapping)
+    checks = []
+    index.build(lambda: checks.append(None), lambda offset: None)
+    return index, len(checks)
+
+def test_index_matches_every_line_start(tmp_path, monkeypatch):
+    monkeypatch.setattr(scratchpad, 'LINE_INDEX_CHUNK_BYTES', 997)
+    rng = random.Random(6)
+    lines = [b'x' * rng.choice([0, 1, 5, 40, 3000]) for _ in range(3 * LINE_INDEX_STRIDE + 17)]
+    data = b'\n'.join(lines)
+    path = tmp_path / 'lines.txt'
+    path.write_bytes(data)
+    index, _ = build_index(path)
+    assert index.complete and index.known_lines() == len(lines)
+    start = 0
+    for number, line in enumerate(lines):
+        assert index.line_start(number) == start
+        assert index.line_at(start) == number
+        start += len(line) + 1
+
+def test_long_line_without_newline_is_scanned_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(scratchpad, 'LINE_INDEX_CHUNK_BYTES', 64 * 1024)
+    path = tmp_path / 'long.txt'
+    path.write_bytes(b'line\n' * (LINE_INDEX_STRIDE + 3) + b'x' * (4 * 1024 * 1024))
+    index, checks = build_index(path)
+    assert index.complete and index.known_lines() == LINE_INDEX_STRIDE + 4
+    assert checks >= 4 * 1024 * 1024 // (64 * 1024)
+    assert index.line_end(index.line_start(LINE_INDEX_STRIDE + 3)) == path.stat().st_size
+
+def test_build_stops_between_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(scratchpad, 'LINE_INDEX_CHUNK_BYTES', 4096)
+    path = tmp_path / 'long.txt'
+    path.write_bytes(b'x' * (1024 * 1024))
+    with open(path, 'rb') as file:
+        index = LineIndex(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    checks = []
+    index.build(lambda: len(checks) > 2 or checks.append(None), lambda offset: None)
+    assert not index.complete and len(checks) == 3
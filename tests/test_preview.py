@@ -0,0 +1,43 @@
+import os
+
+from PyQt5.QtGui import QFont, QTextDocument
+
+import markdown_preview
+from scratchpad import PreviewDocument
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOTE = '# Title\n\nSome *body* text.\n\n- one\n- two\n\n> quoted\n\nLast paragraph.\n'
+
+def text_blocks(document):
+    """Yield (text, left edge, resolved font family) for each block with text."""
+    layout = document.documentLayout()
+    block = document.begin()
+    while block.isValid():
+        if block.text().strip():
+            font = block.begin().fragment().charFormat().font().resolve(document.defaultFont())
+            yield block.text(), layout.blockBoundingRect(block).left(), font.family()
+        block = block.next()
+
+def test_patched_preview_matches_set_html(qapp):
+    with open(os.path.join(ROOT, 'style.css'), encoding='utf-8') as file:
+        template = markdown_preview.parse_markdown_template(file.read())
+    renderer = markdown_preview.IncrementalMarkdownRenderer()
+    documents = []
+    for _ in range(2):
+        document = QTextDocument()
+        document.setDefaultFont(QFont('Cascadia Code', 11))
+        document.setTextWidth(600)
+        documents.append(document)
+    patched, reference = documents
+    PreviewDocument(patched).update(renderer.convert_pieces(NOTE), markdown_preview.template_stylesheet(template))
+    reference.setHtml(markdown_preview.render_markdown(renderer, NOTE, template))
+
+    assert patched.defaultFont().family() != 'Cascadia Code'
+    assert patched.rootFrame().frameFormat() == reference.rootFrame().frameFormat()
+    assert list(text_blocks(patched)) == list(text_blocks(reference))
+
+def test_incremental_render_matches_full_render():
+    renderer = markdown_preview.IncrementalMarkdownRenderer()
+    for text in (NOTE, '    \n\n\n', '\t\n', '\n\n   \n\nLead-in blank lines.\n',
+                 'a\n\n    \n\nb\n', '    code\n\n    \n\nafter\n'):
+        assert renderer.convert(text) == renderer.convert_full(text).strip(), repr(text)
@@ -0,0 +1,92 @@
+import os
+import random
+
+from PyQt5.QtGui import QTextCursor, QTextDocument
+
+from scratchpad import RecoveryJournal
+
+def crashed_journal(directory, file_path, edit, wait, compact=True):
+    """Journal an edit to file_path's text, optionally compact it, and leave it as a crashed Scratchpad would."""
+    document = QTextDocument()
+    # Without a layout a document reports no contentsChange for the journal to record.
+    document.documentLayout()
+    with open(file_path, encoding='utf-8') as file:
+        document.setPlainText(file.read())
+    journal = RecoveryJournal(document, str(file_path), directory=str(directory))
+    edit(document)
+    journal.commit()
+    if compact:
+        journal.compact()
+        wait(lambda: journal.snapshot_saver is None)
+    journal.lock.unlock()
+    [abandoned] = RecoveryJournal.abandoned(str(directory))
+    return abandoned
+
+def test_recovered_snapshot_without_later_edits_stays_modified(qapp, wait, window, tmp_path):
+    path = tmp_path / 'note.txt'
+    path.write_text('on disk\n', encoding='utf-8')
+    journal = crashed_journal(tmp_path / 'recovery', path, lambda document: QTextCursor(document).insertText('unsaved '),
+                              wait)
+    assert journal.header['base'] == 'snapshot' and not list(journal.edits())
+    window.recoverJournal(journal)
+    tab = window.tab
+    wait(lambda: tab.journal is journal)
+    assert tab.document.toPlainText() == 'unsaved on disk\n'
+    assert tab.document.isModified() and tab.is_modified()
+
+def replayed_text(journal):
+    """Load a journal's base and replay its edits, as recovery does."""
+    base = journal.base_path()
+    document = QTextDocument()
+    if base is not None:
+        with open(base, encoding='utf-8') as file:
+            document.setPlainText(file.read())
+    journal.replay(document)
+    return document.toPlainText()
+
+def test_replay_reproduces_edits_before_and_after_compaction(qapp, wait, tmp_path):
+    path = tmp_path / 'note.txt'
+    path.write_text('first line\nsecond line\n', encoding='utf-8')
+    document = QTextDocument()
+    document.documentLayout()
+    document.setPlainText(path.read_text(encoding='utf-8'))
+    directory = tmp_path / 'recovery'
+    journal = RecoveryJournal(document, str(path), directory=str(directory))
+    rng = random.Random(18)
+    expected = []
+    for round_number in range(3):
+        for _ in range(20):
+            cursor = QTextCursor(document)
+            end = document.characterCount() - 1
+            start = rng.randint(0, end)
+            cursor.setPosition(start)
+            cursor.setPosition(rng.randint(start, min(end, start + 6)), QTextCursor.KeepAnchor)
+            # Random positions could split a surrogate pair, which no editor cursor does.
+            cursor.insertText(rng.choice(['', 'x', 'new\nline', 'éü']))
+        journal.commit()
+        if round_number < 2:
+            journal.compact()
+            wait(lambda: journal.snapshot_saver is None)
+        expected.append(document.toPlainText())
+    journal.lock.unlock()
+    [recovered] = RecoveryJournal.abandoned(str(directory))
+    assert recovered.header['base'] == 'snapshot' and recovered.header['generation'] == 2
+    assert replayed_text(recovered) == expected[-1]
+    # Logs and snapshots older than the current generation are gone.
+    assert all(name.split('.')[1] == '2' for name in os.listdir(directory) if name.count('.') == 2)
+    recovered.discard()
+    assert [name for name in os.listdir(directory) if not name.endswith('.lock')] == []
+
+def test_replay_onto_the_file_base(qapp, wait, tmp_path):
+    path = tmp_path / 'note.txt'
+    path.write_text('alpha\nbeta\n', encoding='utf-8')
+
+    def edit(document):
+        cursor = QTextCursor(document)
+        cursor.setPosition(6)
+        cursor.setPosition(10, QTextCursor.KeepAnchor)
+        cursor.insertText('BETA')
+
+    journal = crashed_journal(tmp_path / 'recovery', path, edit, wait, compact=False)
+    assert journal.header['base'] == 'file'
+    assert replayed_text(journal) == 'alpha\nBETA\n'
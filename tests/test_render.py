@@ -0,0 +1,56 @@
+import os
+
+import markdown_preview
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOTE = '# Café notes\n\nCrème brûlée, naïve façade, and ÿ at the end.\n'
+
+def test_batch_render_decodes_notes_like_the_editor(tmp_path):
+    with open(os.path.join(ROOT, 'style.css'), encoding='utf-8') as file:
+        template = markdown_preview.parse_markdown_template(file.read())
+    source = tmp_path / 'notes' / 'cafe.md'
+    source.parent.mkdir()
+    source.write_bytes(NOTE.encode('cp1252'))
+    out_dir = tmp_path / 'html'
+    reports = []
+    assert markdown_preview.render_batch([str(source.parent)], str(out_dir), template, jobs=1,
+                                         report=reports.append) == 0, reports
+    html = (out_dir / 'cafe.html').read_text(encoding='utf-8')
+    assert 'Crème brûlée, naïve façade, and ÿ at the end.' in html
+
+def test_sources_with_the_same_name_do_not_overwrite_each_other(tmp_path):
+    with open(os.path.join(ROOT, 'style.css'), encoding='utf-8') as file:
+        template = markdown_preview.parse_markdown_template(file.read())
+    first = tmp_path / 'notes' / 'n1.md'
+    second = tmp_path / 'notes' / 'sub' / 'n1.md'
+    second.parent.mkdir(parents=True)
+    first.write_text('first\n', encoding='utf-8')
+    second.write_text('second\n', encoding='utf-8')
+    out_dir = tmp_path / 'html'
+    reports = []
+    failed = markdown_preview.render_batch([str(first), str(second), str(first)], str(out_dir), template, jobs=2,
+                                           report=reports.append)
+    assert failed == 1
+    assert str(second) in reports[0] and 'Rendered 1 files' in reports[-1]
+    assert '<p>first</p>' in (out_dir / 'n1.html').read_text(encoding='utf-8')
+
+def test_a_note_that_fails_to_render_does_not_stop_the_batch(tmp_path, monkeypatch):
+    with open(os.path.join(ROOT, 'style.css'), encoding='utf-8') as file:
+        template = markdown_preview.parse_markdown_template(file.read())
+    render_markdown = markdown_preview.render_markdown
+
+    def fragile_render(renderer, text, *args, **kwargs):
+        if 'boom' in text:
+            raise RecursionError
+        return render_markdown(renderer, text, *args, **kwargs)
+
+    monkeypatch.setattr(markdown_preview, 'render_markdown', fragile_render)
+    notes = tmp_path / 'notes'
+    notes.mkdir()
+    for name, text in (('a.md', 'fine\n'), ('b.md', 'boom\n'), ('c.md', 'also fine\n')):
+        (notes / name).write_text(text, encoding='utf-8')
+    out_dir = tmp_path / 'html'
+    reports = []
+    assert markdown_preview.render_batch([str(notes)], str(out_dir), template, jobs=1, report=reports.append) == 1
+    assert reports[0] == f"{notes / 'b.md'}: RecursionError"
+    assert sorted(os.listdir(out_dir)) == ['.scratchpad-render.json', 'a.html', 'c.html']
@@ -0,0 +1,39 @@
+import random
+
+from PyQt5.QtGui import QTextCursor, QTextDocument
+
+from scratchpad import DocumentStats
+
+def recount(document):
+    text = document.toPlainText()
+    return len(text), len(text.split()), document.blockCount()
+
+def test_counts_match_a_full_recount_after_random_edits(qapp):
+    rng = random.Random(10)
+    document = QTextDocument()
+    document.documentLayout()
+    stats = DocumentStats(document)
+    pieces = ['', 'word', ' ', '\n', 'two words\n', '\n\n', '\t', 'é']
+    for _ in range(500):
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        for _ in range(rng.choice([1, 1, 3])):
+            end = document.characterCount() - 1
+            start = rng.randint(0, end)
+            cursor.setPosition(start)
+            cursor.setPosition(rng.randint(start, min(end, start + rng.choice([0, 3, 30]))), QTextCursor.KeepAnchor)
+            cursor.insertText(''.join(rng.choice(pieces) for _ in range(rng.randint(0, 4))))
+        cursor.endEditBlock()
+        assert (stats.characters, stats.words, stats.lines) == recount(document)
+
+def test_catch_up_counts_text_added_without_a_layout(qapp):
+    document = QTextDocument()
+    stats = DocumentStats(document)
+    QTextCursor(document).insertText('loaded in\nthe background\n')
+    changes = []
+    stats.changed.connect(lambda: changes.append(None))
+    stats.catch_up()
+    assert (stats.characters, stats.words, stats.lines) == recount(document)
+    # Nothing changed since, so the counts are only reported again.
+    stats.catch_up()
+    assert len(changes) == 2 and (stats.characters, stats.words, stats.lines) == recount(document)
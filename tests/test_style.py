@@ -0,0 +1,20 @@
+import os
+import scratchpad
+
+def test_user_stylesheet_is_picked_up_without_watching_home(qapp, tmp_path, monkeypatch):
+    monkeypatch.setattr(os.path, 'expanduser', lambda path: str(tmp_path) if path == '~' else path)
+    styles = scratchpad.StyleResources()
+    changes = []
+    styles.changed.connect(lambda: changes.append(True))
+    assert not styles.watcher.directories()
+    default = styles.stylesheet()
+
+    user_css = tmp_path / 'spstyle.css'
+    user_css.write_text('QWidget { color: red; }', encoding='utf-8')
+    styles.on_application_state_changed(scratchpad.Qt.ApplicationActive)
+    assert changes and styles.stylesheet() == 'QWidget { color: red; }'
+    assert str(user_css) in styles.watcher.files() and not styles.watcher.directories()
+
+    user_css.unlink()
+    styles.check_user_css()
+    assert len(changes) == 2 and styles.stylesheet() == default
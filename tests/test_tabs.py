@@ -0,0 +1,19 @@
+import scratchpad
+
+def test_switching_to_released_tab_whose_file_is_gone(qapp, wait, window, tmp_path, monkeypatch):
+    errors = []
+    monkeypatch.setattr(scratchpad.QMessageBox, 'critical', lambda parent, title, message: errors.append(message))
+    path = tmp_path / 'gone.txt'
+    path.write_text('text\n', encoding='utf-8')
+    window.openPath(str(path))
+    released = window.tab
+    wait(lambda: released.document is not None and not released.is_busy())
+    window.newTab()
+    window.releaseTab(released)
+    path.unlink()
+
+    window.tab_bar.setCurrentIndex(window.tabs.index(released))
+    wait(lambda: errors)
+    assert window.tab is released and window.tabs.count(released) == 1
+    assert released.document is not None and released.document.isEmpty()
+    assert window.editor.document() is released.document and not window.editor.isReadOnly()
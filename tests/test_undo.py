@@ -0,0 +1,116 @@
+import random
+
+import pytest
+from PyQt5.QtGui import QTextCursor, QTextDocument
+
+from scratchpad import UndoHistory
+
+ALPHABET = ['a', 'b', ' ', '\n', '\n', 'x', '😀', 'é']
+
+def random_text(rng, length):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, length)))
+
+def new_document(text=''):
+    document = QTextDocument()
+    # Without a layout a document reports no contentsChange for the history to record.
+    document.documentLayout()
+    QTextCursor(document).insertText(text)
+    return document
+
+def random_edit(rng, document, history):
+    """Make one expected edit: a typed run, a replaced selection, or several edits in one block."""
+    cursor = QTextCursor(document)
+    if rng.random() < 0.3:
+        with history.expecting():
+            cursor.beginEditBlock()
+            for _ in range(rng.randint(1, 4)):
+                end = document.characterCount() - 1
+                start = rng.randint(0, end)
+                cursor.setPosition(start)
+                cursor.setPosition(rng.randint(start, min(end, start + 5)), QTextCursor.KeepAnchor)
+                cursor.insertText(random_text(rng, 4))
+            cursor.endEditBlock()
+    else:
+        end = document.characterCount() - 1
+        start = rng.randint(0, end)
+        stop = rng.randint(start, min(end, start + rng.choice([0, 1, 10])))
+        cursor.setPosition(start)
+        cursor.setPosition(stop, QTextCursor.KeepAnchor)
+        with history.expecting(start, stop):
+            cursor.insertText(random_text(rng, rng.choice([1, 1, 8])))
+
+@pytest.mark.parametrize('limit', [10 ** 9, 300, 0])
+def test_undo_all_and_redo_all_round_trip(qapp, limit):
+    for seed in range(40):
+        rng = random.Random(seed)
+        document = new_document(random_text(rng, 40))
+        history = UndoHistory(document, limit=limit)
+        document.setModified(False)
+        texts = [document.toPlainText()]
+        for _ in range(rng.randint(1, 25)):
+            random_edit(rng, document, history)
+            if document.toPlainText() != texts[-1]:
+                texts.append(document.toPlainText())
+        if limit < 10 ** 9 and len(texts) > 3:
+            assert history.spilled['undo'], seed
+        # Typing merges into one step, so undo passes through a subsequence of the texts.
+        undone = [document.toPlainText()]
+        while history.steps['undo']:
+            history.undo()
+            undone.append(document.toPlainText())
+        assert undone[-1] == texts[0], seed
+        remaining = iter(reversed(texts))
+        assert all(text in remaining for text in undone), seed
+        assert not document.isModified()
+        redone = [document.toPlainText()]
+        while history.steps['redo']:
+            history.redo()
+            redone.append(document.toPlainText())
+        assert redone == undone[::-1], seed
+        assert history.memory >= 0 and (limit or history.memory == 0)
+
+def test_undo_back_to_the_saved_text_clears_modified(qapp):
+    document = new_document('saved')
+    history = UndoHistory(document)
+    document.setModified(False)
+    cursor = QTextCursor(document)
+    cursor.movePosition(QTextCursor.End)
+    with history.expecting(5, 5):
+        cursor.insertText(' and edited')
+    assert document.isModified()
+    history.undo()
+    assert document.toPlainText() == 'saved' and not document.isModified()
+    history.redo()
+    assert document.toPlainText() == 'saved and edited' and document.isModified()
+
+def test_unexpected_removal_clears_the_history(qapp):
+    document = new_document('one two')
+    history = UndoHistory(document)
+    with history.expecting(0, 3):
+        cursor = QTextCursor(document)
+        cursor.setPosition(3, QTextCursor.KeepAnchor)
+        cursor.insertText('three')
+    assert history.steps['undo']
+    QTextCursor(document).deleteChar()
+    assert not history.steps['undo'] and not history.steps['redo']
+
+def test_history_survives_release_only_if_the_text_is_unchanged(qapp):
+    document = new_document('alpha\nbeta\n')
+    history = UndoHistory(document, limit=10 ** 9)
+    cursor = QTextCursor(document)
+    cursor.movePosition(QTextCursor.End)
+    with history.expecting(11, 11):
+        cursor.insertText('gamma\n')
+    history.release()
+    assert history.spilled['undo'] == 1 and history.memory == 0
+
+    reloaded = new_document('alpha\nbeta\ngamma\n')
+    history.reattach(reloaded)
+    history.undo()
+    assert reloaded.toPlainText() == 'alpha\nbeta\n'
+    history.redo()
+    history.release()
+
+    changed = new_document('alpha\nBETA\ngamma\n')
+    history.reattach(changed)
+    assert not history.steps['undo'] and not history.steps['redo']
@@ -0,0 +1,68 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scratchpad import WebCache, WebFetcher
+
+class PageHandler(BaseHTTPRequestHandler):
+    body = 'Café notes\n'.encode('utf-8')
+    etag = '"v1"'
+    content_length = None
+    requests = []
+
+    def do_GET(self):
+        PageHandler.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', self.content_length or str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    PageHandler.requests = []
+    PageHandler.content_length = None
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/page.txt'
+    httpd.shutdown()
+    httpd.server_close()
+
+def fetch(url, cache):
+    """Run a fetch on the calling thread and return its (signal, arguments) results."""
+    fetcher = WebFetcher(url, cache)
+    results = []
+    fetcher.fetched.connect(lambda text, from_cache: results.append(('fetched', text, from_cache)))
+    fetcher.failed.connect(lambda message: results.append(('failed', message)))
+    fetcher.run()
+    return results
+
+def test_unchanged_page_is_served_from_cache(qapp, server, tmp_path):
+    cache = WebCache(str(tmp_path))
+    assert fetch(server, cache) == [('fetched', 'Café notes\n', False)]
+    assert fetch(server, cache) == [('fetched', 'Café notes\n', True)]
+    assert PageHandler.requests == [None, '"v1"']
+
+def test_malformed_content_length_is_ignored(qapp, server, tmp_path):
+    PageHandler.content_length = 'lots'
+    assert fetch(server, WebCache(str(tmp_path))) == [('fetched', 'Café notes\n', False)]
+
+def test_cache_evicts_least_recently_used_pages(tmp_path):
+    cache = WebCache(str(tmp_path), max_bytes=250)
+    for name in ('a', 'b', 'c'):
+        cache.store(f'http://example.com/{name}', {'ETag': name}, b'x' * 100)
+        if name == 'b':
+            cache.read_body('http://example.com/a')
+    assert cache.lookup('http://example.com/a') is not None
+    assert cache.lookup('http://example.com/b') is None
+    assert cache.lookup('http://example.com/c') is not None
@@ -0,0 +1,67 @@
+"""Encoding detection shared by the editor and the Markdown renderer.
+
+Kept free of Qt so batch rendering workers can decode files the same way
+the editor does.
+"""
+import codecs
+import os
+
+ENCODING_HEAD_BYTES = 256 * 1024
+ENCODING_WINDOW_BYTES = 64 * 1024
+ENCODING_CACHE_SIZE = 256
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+_encoding_cache = {}
+
+def is_valid_utf8(window, at_start, at_end):
+    """Check a sampled window strictly as UTF-8, allowing characters cut at its edges."""
+    skip = 0
+    if not at_start:
+        while skip < min(3, len(window)) and 0x80 <= window[skip] < 0xC0:
+            skip += 1
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(window[skip:], final=at_end)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def detect_encoding(file_path):
+    """Detect a file's encoding, cached per (path, size, mtime).
+
+    A byte order mark wins outright. Otherwise the head, middle and tail of
+    the file are validated as strict UTF-8, and only if that fails is
+    chardet run, on the head alone.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key in _encoding_cache:
+        return _encoding_cache[key]
+    with open(file_path, 'rb') as file:
+        head = file.read(ENCODING_HEAD_BYTES)
+        windows = [(head, True, len(head) == stat.st_size)]
+        for offset in (stat.st_size // 2, stat.st_size - ENCODING_WINDOW_BYTES):
+            if offset > len(head):
+                file.seek(offset)
+                window = file.read(ENCODING_WINDOW_BYTES)
+                windows.append((window, False, offset + len(window) >= stat.st_size))
+    encoding = None
+    for bom, bom_encoding in BYTE_ORDER_MARKS:
+        if head.startswith(bom):
+            encoding = bom_encoding
+            break
+    if encoding is None:
+        if all(is_valid_utf8(*window) for window in windows):
+            encoding = 'utf-8'
+        else:
+            import chardet
+            encoding = chardet.detect(head)['encoding'] or 'utf-8'
+    if len(_encoding_cache) >= ENCODING_CACHE_SIZE:
+        del _encoding_cache[next(iter(_encoding_cache))]
+    _encoding_cache[key] = encoding
+    return encoding
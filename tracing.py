@@ -0,0 +1,100 @@
+"""Opt-in timing spans for Scratchpad's hot paths, exportable as Chrome trace JSON.
+
+Enable with SCRATCHPAD_TRACE=1 or --trace. When disabled, span() returns a
+shared do-nothing context manager, so instrumented code pays one attribute
+check per call.
+"""
+import os
+import json
+import threading
+import time
+from collections import deque
+
+TRACE_BUFFER_EVENTS = 200000
+
+class NullSpan:
+    """Context manager that records nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    """Records one complete ("X") trace event when it exits."""
+    __slots__ = ('tracer', 'name', 'category', 'args', 'started')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        ended = time.perf_counter_ns()
+        self.tracer.record(self.name, self.category, self.started, ended - self.started, self.args)
+        return False
+
+class Tracer:
+    """Ring buffer of timing spans from every thread.
+
+    deque.append is atomic, so spans can be recorded from worker threads
+    without a lock; once the buffer is full the oldest spans are dropped.
+    """
+    def __init__(self, capacity=TRACE_BUFFER_EVENTS):
+        self.enabled = False
+        self.events = deque(maxlen=capacity)
+        self.thread_names = {}
+        self.origin = time.perf_counter_ns()
+
+    def enable(self, capacity=None):
+        if capacity:
+            self.events = deque(self.events, maxlen=capacity)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, category='editor', **args):
+        """Return a context manager that times its block."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def record(self, name, category, started, duration, args):
+        thread = threading.current_thread()
+        self.thread_names.setdefault(thread.ident, thread.name)
+        self.events.append((name, category, started, duration, thread.ident, args))
+
+    def clear(self):
+        self.events.clear()
+
+    def chrome_trace(self):
+        """Return the recorded spans in Chrome trace-event format."""
+        pid = os.getpid()
+        trace_events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                        for tid, name in list(self.thread_names.items())]
+        for name, category, started, duration, tid, args in list(self.events):
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                     'ts': (started - self.origin) / 1000, 'dur': duration / 1000}
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        """Write the recorded spans to path as Chrome trace JSON; return the span count."""
+        trace = self.chrome_trace()
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(trace, file)
+        return sum(1 for event in trace['traceEvents'] if event['ph'] == 'X')
+
+tracer = Tracer()
+if os.environ.get('SCRATCHPAD_TRACE'):
+    tracer.enable()